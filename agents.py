@@ -1,41 +1,125 @@
 import os
-from dotenv import load_dotenv
-from serpapi import GoogleSearch
-import yfinance as yf
-import together
+from concurrent.futures import ThreadPoolExecutor
+from cache import DiskCache
+from article_index import article_index
+from clients import registry
+from scheduler import scheduler, ProviderError
+from deadline import DeadlineExceeded, call_with_deadline, format_age, mark_stale
+from market_data import symbol_market_data
+from tracing import tracer
+from local_model import local_model_id, local_summarizer
+from extractive import condense_articles, extractive_summaries
+from prompt_builder import PROMPT_VERSION, build_summary_prompt, build_batch_prompt, parse_batch_summaries, count_tokens
+from config import (
+    CACHE_PATH, NEWS_CACHE_TTL, NEWS_CACHE_STALE_TTL, NEWS_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_ENTRIES, PROMPT_TOKEN_BUDGET, STREAM_OUTPUT, SUMMARY_ENGINE,
+    EXTRACTIVE_SENTENCES, FALLBACK_SENTENCES, SUMMARY_DEADLINE, BATCH_SUMMARY_SIZE
+)
+
+MODEL = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
+
+# Bump whenever the editor prompt changes so cached completions are not reused
+EDITOR_PROMPT_VERSION = 1
+
+news_cache = DiskCache(CACHE_PATH, "news", NEWS_CACHE_TTL, NEWS_CACHE_MAX_ENTRIES, NEWS_CACHE_STALE_TTL)
+summary_cache = DiskCache(CACHE_PATH, "summaries", SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_ENTRIES)
+
+def search_news(search_params, clients=registry, max_age=None):
+    """Runs a SerpAPI news search through the on-disk news cache, searching again past `max_age` seconds."""
+    def search():
+        results = clients.serpapi_search(search_params)
+        # SerpAPI reports failures in the body; raise so the scheduler can retry them
+        error = results.get("error")
+        if error and "hasn't returned any results" not in error:
+            raise ProviderError(error)
+        return results.get("news_results", [])
+
+    def fetch():
+        return scheduler.call("serpapi", search)
+    key = DiskCache.make_key(search_params)
+    try:
+        return news_cache.get_or_fetch(key, fetch, max_age=max_age)
+    except Exception:
+        # Past its deadline or out of retries: any earlier result beats no news at all
+        entry = news_cache.get(key)
+        if entry is None or not entry[0]:
+            mark_stale("news unavailable")
+            raise
+        mark_stale(f"news from {format_age(entry[1])} ago")
+        return entry[0]
+
+def canonical_articles(news_articles):
+    """Reduces articles to the sorted (title, snippet) pairs that end up in a prompt."""
+    return sorted(
+        (article.get('title', '').strip(), article.get('snippet', 'No summary available').strip())
+        for article in news_articles
+    )
+
+def complete(prompt, max_tokens, stream=False, clients=registry):
+    """Runs a Together completion (streamed with `stream`) and returns its text, or None if malformed."""
+    payload = {
+        "prompt": prompt,
+        "model": MODEL,
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+    }
+    with tracer.span("llm", stream=stream):
+        usage = None
+        if stream:
+            text = scheduler.call("together", lambda: "".join(clients.together_stream(payload))).strip() or None
+        else:
+            response = scheduler.call("together", clients.together_complete, payload)
 
-# Load environment variables from .env file
-load_dotenv()
+            if isinstance(response, dict) and 'output' in response:
+                text = response['output']['choices'][0]['text'].strip()
+            elif isinstance(response, dict) and 'choices' in response:
+                text = response['choices'][0]['text'].strip()
+            else:
+                text = None
+            if isinstance(response, dict):
+                usage = response.get('usage')
+
+        # Prefer the provider's own token usage, falling back to the local estimate
+        prompt_tokens = usage.get('prompt_tokens') if usage else count_tokens(prompt)
+        completion_tokens = usage.get('completion_tokens') if usage else count_tokens(text or "")
+        tracer.annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        tracer.count("llm_prompt_tokens", prompt_tokens)
+        tracer.count("llm_completion_tokens", completion_tokens)
+        tracer.count("llm_requests")
+        return text
+
+def summary_model(engine=SUMMARY_ENGINE):
+    return local_model_id() if engine == "local" else MODEL
+
+def summary_key(company_name, prompt, token_budget, engine=SUMMARY_ENGINE):
+    """Content-addressed cache key for one company's summary of the articles packed into `prompt`."""
+    return DiskCache.hash_key(
+        summary_model(engine), PROMPT_VERSION, token_budget, company_name, canonical_articles(prompt.articles)
+    )
+
+def cached_complete(key, prompt, max_tokens, stream=False, clients=registry):
+    """Returns the memoized completion for `key`, calling Together only on a cache miss."""
+    return summary_cache.get_or_fetch(
+        key, lambda: complete(prompt, max_tokens, stream, clients), should_cache=lambda text: bool(text)
+    )
 
 class StockDataAgent:
     """Agent responsible for fetching stock data."""
-    def __init__(self, stock_symbol):
+    def __init__(self, stock_symbol, market_data=None, clients=registry):
         self.stock_symbol = stock_symbol
+        self.market_data = market_data
+        self.clients = clients
         self.role = "Fetching real-time stock data."
         self.context = f"Stock symbol: {stock_symbol}"
         self.backstory = "This agent has a long history of fetching stock prices and analyzing trends based on Yahoo Finance API."
 
     def get_stock_data(self):
         """Fetches stock data for a given stock symbol."""
+        # Use the row from the batch market-data fetch when one was handed in
         try:
-            stock = yf.Ticker(self.stock_symbol)
-            hist = stock.history(period="1d") 
-            if len(hist) == 0:
-                return None 
-            closing_price = hist['Close'].iloc[-1]
-            # Calculate change from yesterday's closing price
-            hist = stock.history(period="2d")
-            if len(hist) < 2:
-                previous_closing_price = closing_price
-                change_percent = 0
-            else:
-                previous_closing_price = hist['Close'].iloc[-2]
-                change_percent = ((closing_price - previous_closing_price) / previous_closing_price) * 100
-            return {
-                "closing_price": closing_price,
-                "change_percent": change_percent
-            }
+            return symbol_market_data(self.stock_symbol, self.market_data, self.clients)
         except Exception as e:
+            tracer.error(e)
             print(f"Error fetching stock data for {self.stock_symbol}: {e}")
             return None
 
@@ -50,16 +134,17 @@ class StockDataAgent:
 
 class NewsAgent:
     """Agent responsible for fetching news articles related to a company."""
-    def __init__(self, company_name, stock_symbol):
+    def __init__(self, company_name, stock_symbol, clients=registry):
         self.company_name = company_name
         self.stock_symbol = stock_symbol
+        self.clients = clients
         self.role = "Fetching the latest news articles for the given company."
         self.context = f"Company: {company_name}, Stock Symbol: {stock_symbol}"
         self.backstory = "This agent is skilled in using SerpAPI to retrieve the most up-to-date news articles related to stock markets."
         self.api_key = os.getenv("SERPAPI_KEY")
 
-    def fetch_news_articles(self):
-        """Fetches news articles related to the company using SerpAPI."""
+    def fetch_news_articles(self, max_age=None):
+        """Fetches news articles related to the company using SerpAPI, cached for at most `max_age` seconds."""
         try:
             search_params = {
                 "q": f"{self.company_name} stock news",
@@ -67,11 +152,10 @@ class NewsAgent:
                 "engine": "google_news",
                 "tbm": "nws"
             }
-            search = GoogleSearch(search_params)
-            results = search.get_dict()
-            articles = results.get("news_results", [])
-            return articles
+            # Articles other companies' searches already returned come back as the same shared copy
+            return article_index.add(self.stock_symbol, search_news(search_params, self.clients, max_age))
         except Exception as e:
+            tracer.error(e)
             print(f"Error fetching news for {self.company_name}: {e}")
             return []
 
@@ -85,83 +169,180 @@ class NewsAgent:
         return self.backstory
 
 class SummaryAgent:
-    def __init__(self):
+    def __init__(self, stream=STREAM_OUTPUT, clients=registry, engine=SUMMARY_ENGINE,
+                 extractive_sentences=EXTRACTIVE_SENTENCES, deadline=SUMMARY_DEADLINE):
         self.role = "Expert financial summarizer."
         self.context = "Generating concise, impactful summaries of financial news for informed investors."
         self.backstory = "I am a highly skilled financial analyst with a passion for making complex information accessible."
-        
-    def summarize(self, news_articles, company_name):
+        # Token count of the most recent summary prompt
+        self.last_prompt_tokens = 0
+        # Consume completions as a token stream
+        self.stream = stream
+        self.clients = clients
+        # "together" or "local"
+        self.engine = engine
+        # Snippet sentences kept per company in a prompt (0 keeps whole snippets)
+        self.extractive_sentences = extractive_sentences
+        # Seconds to wait for the LLM before falling back to the extractive summary (0 waits
+        # indefinitely); the run's SLA can cut it shorter
+        self.deadline = deadline
+        # Companies whose summary fell back to the extractive one
+        self.fallbacks = set()
+
+    def generate(self, key, prompt):
+        """Returns the memoized summary for `prompt`, generating it with the configured engine on a miss."""
+        if self.engine == "local":
+            return summary_cache.get_or_fetch(
+                key, lambda: local_summarizer().generate([prompt])[0], should_cache=lambda text: bool(text)
+            )
+        return cached_complete(key, prompt, 300, self.stream, self.clients)
+
+    def condense(self, company_articles):
+        """Keeps only the top-ranked snippet sentences of each company's articles for the prompts."""
+        if not self.extractive_sentences:
+            return company_articles
+        return condense_articles(company_articles, self.extractive_sentences)
+
+    def fallback(self, company_articles):
+        """Extractive summaries (company name -> summary) for when the LLM fails or misses its deadline."""
+        tracer.count("summary_fallbacks", len(company_articles))
+        self.fallbacks.update(company_articles)
+        return extractive_summaries(company_articles, FALLBACK_SENTENCES)
+
+    def summarize(self, news_articles, company_name, token_budget=PROMPT_TOKEN_BUDGET, prompt_articles=None):
+        """Summarizes the news articles, packing the prompt into `token_budget` tokens.
+
+        `prompt_articles` are the articles already condensed alongside other companies'; by
+        default the articles are condensed on their own.
+        """
         if not news_articles:
             return "No significant news to summarize."
-        try:
-            text = ". ".join([f"{article['title']}. {article.get('snippet', 'No summary available')}" for article in news_articles])
-        
-            prompt = f"""
-            You are a financial expert. Provide a concise, informative, and engaging summary (under 200 words) of the following news articles related to {company_name} stock. Focus on key findings, important metrics, potential impacts on the stock price, and overall market sentiment. The summary should be well structured, written in a style similar to Inshorts, and directly presentable in a financial newsletter. 
-            
-            For Example: 
-            Bad Response:
-            Tesla's stock has plummeted over 40% due to declining sales in China and poor German sales data. Despite this, there are 3 key reasons the stock is rising: overcoming bad sales data, strong brand loyalty, and innovative products. However, Elon Musk's net worth has dropped by $116 billion from its peak, and boardroom insider Robyn Denholm has added to the pain. Overall, the stock is facing a nightmare, but there are signs of resilience. With market sentiment being bearish, investors should be cautious, but also watch for potential buying opportunities.
-            ```
-
-            Note that the original response already meets the instruction to provide a concise summary under 200 words, and it effectively captures the key points from the news articles. The only issue identified was the unnecessary phrase at the beginning, which has been removed in the rewritten response.
-
-            The rewritten response remains the same as the original response, as it has already been corrected to meet the instruction following standard:
-
-
-            Tesla's stock has plummeted over 40% due to declining sales in China and poor German sales data. Despite this, there are 3 key reasons the stock is rising: overcoming bad sales data, strong brand loyalty, and innovative products. However, Elon Musk's net worth has dropped by $116 billion from its peak, and boardroom insider Robyn Denholm has added to the pain. Overall, the stock is facing a nightmare, but there are signs of resilience. With market sentiment being bearish, investors should be
-
-            Good Response:
-
-            Tesla's stock has plummeted over 40% due to declining sales in China and poor German sales data. Despite this, there are 3 key reasons the stock is rising: overcoming bad sales data, strong brand loyalty, and innovative products. However, Elon Musk's net worth has dropped by $116 billion from its peak, and boardroom insider Robyn Denholm has added to the pain. Overall, the stock is facing a nightmare, but there are signs of resilience. With market sentiment being bearish, investors should be cautious, but also watch for potential buying opportunities.
-
-
-            Bad Response:
-            Nvidia is poised to make significant gains in 2025, driven by promising developments. The company's stock is anticipated to soar, thanks to key announcements from CEO Jensen Huang. With a potential race to a $5 trillion valuation, Nvidia is competing with tech giant Apple. Preliminary market movements show Nvidia's stock on the rise, potentially signaling a perceived bargain. However, billionaire investor Stanley Druckenmiller has recently divested his Nvidia shares, opting for alternative AI investments. Overall, market sentiment remains optimistic, with many expecting Nvidia to make substantial strides in the AI sector, potentially impacting its stock price positively. 
-            ```
+        if prompt_articles is None:
+            prompt_articles = self.condense({company_name: news_articles})[company_name]
+        return self.summarize_condensed(prompt_articles, news_articles, company_name, token_budget)
 
-
-            Nvidia is poised to make significant gains in 2025, driven by promising developments. The company's stock is anticipated to soar, thanks to key announcements from CEO Jensen Huang. With a potential race to a $5 trillion valuation, Nvidia is competing with tech giant Apple. Preliminary market movements show Nvidia's stock on the rise, potentially signaling a perceived bargain. However, billionaire investor Stanley Druckenmiller has recently divested his Nvidia shares, opting for alternative AI investments. Overall, market sentiment remains optimistic, with many expecting Nvidia to make substantial strides in the AI sector, potentially impacting its stock price positively.
-
-            Good Response:
-            Nvidia is poised to make significant gains in 2025, driven by promising developments. The company's stock is anticipated to soar, thanks to key announcements from CEO Jensen Huang. With a potential race to a $5 trillion valuation, Nvidia is competing with tech giant Apple. Preliminary market movements show Nvidia's stock on the rise, potentially signaling a perceived bargain. However, billionaire investor Stanley Druckenmiller has recently divested his Nvidia shares, opting for alternative AI investments. Overall, market sentiment remains optimistic, with many expecting Nvidia to make substantial strides in the AI sector, potentially impacting its stock price positively. 
-
-            News Articles:
-            {text}
-
-            Respond with ONLY the summary and no other text.
-
-            """
-        
-            response = together.Complete.create(
-                prompt=prompt, 
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                max_tokens=300,
-                temperature=0.7,
-            )
-        
-            if isinstance(response, dict) and 'output' in response:
-                summary = response['output']['choices'][0]['text'].strip()
-            elif isinstance(response, dict) and 'choices' in response:
-                summary = response['choices'][0]['text'].strip()
-            else:
-                summary = "Unable to generate summary due to unexpected API response format."
-        
-            return summary
+    def summarize_condensed(self, prompt_articles, news_articles, company_name, token_budget=PROMPT_TOKEN_BUDGET):
+        """Summarizes `prompt_articles`, the condensed form of `news_articles`, which back the fallback."""
+        try:
+            prompt = build_summary_prompt(prompt_articles, company_name, token_budget)
+            self.last_prompt_tokens = prompt.tokens
+            if not prompt.articles:
+                print(f"No article for {company_name} fits the prompt budget; using the extractive summary.")
+                return self.fallback({company_name: news_articles})[company_name]
+
+            key = summary_key(company_name, prompt, token_budget, self.engine)
+            summary = call_with_deadline(lambda: self.generate(key, prompt.text), self.deadline)
+            if summary:
+                return summary
+            print(f"Unexpected API response format summarizing {company_name}; using the extractive summary.")
+        except DeadlineExceeded as e:
+            print(f"Summary for {company_name} missed its deadline ({e}); using the extractive summary.")
         except Exception as e:
+            tracer.error(e)
             print(f"Error generating summary: {e}")
-        return "Unable to generate summary at this time."
+        return self.fallback({company_name: news_articles})[company_name]
+
+    def summarize_batch(self, company_articles, token_budget=PROMPT_TOKEN_BUDGET, batch_size=BATCH_SUMMARY_SIZE):
+        """Summarizes several companies' articles (name -> articles) in batched requests; returns name -> summary."""
+        summaries = {}
+        pending = {}
+        unpacked = []
+        condensed = self.condense({name: articles for name, articles in company_articles.items() if articles})
+        for company_name, news_articles in company_articles.items():
+            if not news_articles:
+                summaries[company_name] = "No significant news to summarize."
+                continue
+            prompt = build_summary_prompt(condensed[company_name], company_name, token_budget)
+            if not prompt.articles:
+                unpacked.append(company_name)
+                continue
+            cached = summary_cache.get_fresh(summary_key(company_name, prompt, token_budget, self.engine))
+            if cached:
+                summaries[company_name] = cached
+            else:
+                pending[company_name] = prompt
+
+        def generate_local():
+            texts = local_summarizer().generate([prompt.text for prompt in pending.values()])
+            generated = {}
+            for (company_name, prompt), summary in zip(pending.items(), texts):
+                if summary:
+                    summary_cache.set(summary_key(company_name, prompt, token_budget, self.engine), summary)
+                    generated[company_name] = summary
+            return generated
+
+        names = list(pending)
+        chunks = [{name: pending[name] for name in names[index:index + batch_size]}
+                  for index in range(0, len(names), batch_size)]
+        # Chunks that finish before a missed deadline still count
+        batched = {}
+
+        def generate_batch(chunk):
+            batch_prompt = build_batch_prompt(chunk)
+            batch = parse_batch_summaries(complete(batch_prompt, 300 * len(chunk), self.stream, self.clients), chunk)
+            for company_name, summary in batch.items():
+                summary_cache.set(summary_key(company_name, chunk[company_name], token_budget, self.engine), summary)
+            batched.update(batch)
+
+        def generate_batches():
+            self.last_prompt_tokens = sum(count_tokens(build_batch_prompt(chunk)) for chunk in chunks)
+            if len(chunks) == 1:
+                generate_batch(chunks[0])
+                return batched
+            workers = min(len(chunks), scheduler.providers["together"].max_concurrency)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(tracer.wrap(generate_batch), chunk) for chunk in chunks]
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        tracer.error(e)
+                        print(f"Error generating batched summaries: {e}")
+            return batched
+
+        timed_out = False
+        if pending and (self.engine == "local" or len(pending) > 1):
+            if self.engine == "local":
+                self.last_prompt_tokens = sum(prompt.tokens for prompt in pending.values())
+            try:
+                summaries.update(call_with_deadline(generate_local if self.engine == "local" else generate_batches,
+                                                    self.deadline))
+            except DeadlineExceeded as e:
+                timed_out = True
+                summaries.update(batched)
+                print(f"Batched summaries missed their deadline ({e}); using extractive summaries.")
+            except Exception as e:
+                tracer.error(e)
+                print(f"Error generating batched summaries: {e}")
+
+        if unpacked:
+            print(f"No article for {', '.join(unpacked)} fits the prompt budget; using extractive summaries.")
+            summaries.update(self.fallback({company_name: company_articles[company_name] for company_name in unpacked}))
+
+        missing = [company_name for company_name in pending if company_name not in summaries]
+        # Greedy local decoding would only repeat the same result, and after a missed
+        # deadline there is no time left for one request per company
+        if missing and (self.engine == "local" or timed_out):
+            summaries.update(self.fallback({company_name: company_articles[company_name] for company_name in missing}))
+        elif missing:
+            for company_name in missing:
+                summaries[company_name] = self.summarize_condensed(
+                    condensed[company_name], company_articles[company_name], company_name, token_budget
+                )
+
+        return {company_name: summaries[company_name] for company_name in company_articles}
 
 class SummaryEditorAgent:
     """Agent responsible for editing the newsletter to remove extra summaries."""
-    def __init__(self):
+    def __init__(self, clients=registry):
+        self.clients = clients
         self.role = "Newsletter editor."
         self.context = "Removing extra summaries from the newsletter."
         self.backstory = ("I am an editor who understands when and where to cut copy for maximum efficiency. "
                           "I am only here to make the newsletter read right.")
 
     def remove_extra_summary(self, newsletter_content):
-        """Removes extra summaries from the newsletter content using LLM."""
+        """Removes extra summaries from the newsletter content (or one summary block) using LLM."""
         try:
             prompt = f"""
                 You are an expert newsletter editor.  You are provided with the content of a financial newsletter below. Your task is to remove any redundant or duplicate paragraphs that appear immediately after the "News Summary:" for each company.  Ensure that the core news summary is retained, and only the immediately following duplicated paragraph is removed. Preserve all other content and formatting.
@@ -172,24 +353,16 @@ class SummaryEditorAgent:
                 Respond with ONLY the cleaned newsletter content.
                 """
 
-            response = together.Complete.create(
-                prompt=prompt,
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                max_tokens=2000,  
-                temperature=0.7,
-            )
-
-            if isinstance(response, dict) and 'output' in response:
-                cleaned_newsletter = response['output']['choices'][0]['text'].strip()
-            elif isinstance(response, dict) and 'choices' in response:
-                cleaned_newsletter = response['choices'][0]['text'].strip()
-            else:
+            key = DiskCache.hash_key(MODEL, EDITOR_PROMPT_VERSION, newsletter_content)
+            cleaned_newsletter = cached_complete(key, prompt, 2000, clients=self.clients)
+            if not cleaned_newsletter:
                 cleaned_newsletter = newsletter_content 
                 print("Unable to clean newsletter due to unexpected API response format.")
 
             return cleaned_newsletter
 
         except Exception as e:
+            tracer.error(e)
             print(f"Error cleaning newsletter: {e}")
             return newsletter_content 
 
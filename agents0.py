@@ -1,14 +1,8 @@
 import os
-from dotenv import load_dotenv
-from serpapi import GoogleSearch
-import yfinance as yf
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
-import torch
-import requests
-from bs4 import BeautifulSoup
+import config  # loads .env
 
-# Load environment variables from .env file
-load_dotenv()
+# yfinance, serpapi, torch and transformers are imported where they are first used, so
+# importing this module stays cheap
 
 class StockDataAgent:
     """Agent responsible for fetching stock data."""
@@ -21,6 +15,7 @@ class StockDataAgent:
     def get_stock_data(self):
         """Fetches stock data for a given stock symbol."""
         try:
+            import yfinance as yf
             stock = yf.Ticker(self.stock_symbol)
             hist = stock.history(period="1d")  # Fetch today's data
             if len(hist) == 0:
@@ -70,6 +65,7 @@ class NewsAgent:
                 "engine": "google_news",
                 "tbm": "nws" # Focus on just google news
             }
+            from serpapi import GoogleSearch
             search = GoogleSearch(search_params)
             results = search.get_dict()
             articles = results.get("news_results", [])
@@ -94,6 +90,9 @@ class SummaryAgent:
         self.context = "Generating concise, impactful summaries of financial news for informed investors."
         self.backstory = "I am a highly skilled financial analyst with a passion for making complex information accessible. I leverage GPT-2 to provide insightful and engaging summaries."
         try:
+            import torch
+            from transformers import GPT2LMHeadModel, GPT2Tokenizer
+            self.torch = torch
             self.model = GPT2LMHeadModel.from_pretrained("gpt2")
             self.tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -139,7 +138,7 @@ class SummaryAgent:
                 no_repeat_ngram_size=2,
                 do_sample=True,
                 temperature=0.7,
-                attention_mask=torch.ones(inputs.shape).to(self.device),
+                attention_mask=self.torch.ones(inputs.shape).to(self.device),
                 pad_token_id=self.tokenizer.eos_token_id
             )
             summary = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
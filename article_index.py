@@ -0,0 +1,138 @@
+import hashlib
+import html
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from cache import DiskCache
+from similarity import words
+from tracing import tracer
+from config import CACHE_PATH, ARTICLE_HISTORY_TTL, ARTICLE_HISTORY_MAX_ENTRIES
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|guccounter|guce_\w+|ncid|cmpid|taid|soc_src|soc_trk)$", re.I)
+
+def canonical_url(url):
+    """Reduces an article URL to one form per page: https, no "www.", fragment or tracking parameters."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query) if not TRACKING_PARAMS.match(key)))
+    return urlunsplit(("https", host, parts.path.rstrip("/") or "/", query, ""))
+
+def content_hash(article):
+    """Hashes an article's title and snippet words, so syndicated copies under other URLs match."""
+    text = " ".join(words(article.get("title") or "")) + "\n" + " ".join(words(article.get("snippet") or ""))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def clean_text(text):
+    return re.sub(r"\s+", " ", html.unescape(text or "")).strip()
+
+class ArticleIndex:
+    """Every news article seen in the current run, whichever search returned it.
+
+    Articles are keyed by canonical URL, with a content hash catching the same story under
+    another URL, so an article returned for several companies is cleaned and counted once
+    and every search gets the same copy. Each article maps back to the tickers whose search
+    returned it. With a `history` cache, articles are also flagged "new" unless an earlier
+    run already saw them. `novel` then trims each ticker's articles to what no other prompt
+    and no earlier run already covered.
+    """
+    def __init__(self, history=None):
+        self.history = history
+        self._lock = threading.Lock()
+        self.start_run()
+
+    def start_run(self):
+        """Forgets the previous run's articles; the history of earlier runs is kept."""
+        with self._lock:
+            self._articles = {}
+            self._aliases = {}
+            # Article key -> {ticker: the article's place in that ticker's search results}
+            self._tickers = {}
+
+    def add(self, ticker, news_articles):
+        """Indexes one search's results for `ticker` and returns its unique articles, in order.
+
+        Each returned article is the shared, cleaned copy, with its index "key" and whether
+        it is "new" since earlier runs.
+        """
+        keyed = [(article, canonical_url(article.get("link")), content_hash(article)) for article in news_articles]
+        with self._lock:
+            unknown = [url or digest for _, url, digest in keyed
+                       if not (self._aliases.get(url) or self._aliases.get(digest))]
+        # History is read and written for the whole search at once, without holding up other searches
+        seen = self._seen_before(unknown)
+        unique = {}
+        with self._lock:
+            for position, (article, url, digest) in enumerate(keyed):
+                key = self._aliases.get(url) or self._aliases.get(digest)
+                if key is None:
+                    key = url or digest
+                    cleaned = {field: clean_text(article[field]) for field in ("title", "snippet") if field in article}
+                    self._articles[key] = dict(article, **cleaned, key=key, new=key not in seen)
+                    self._tickers[key] = {}
+                    tracer.count("articles_unique")
+                    if self.history is not None and key not in seen:
+                        tracer.count("articles_new")
+                elif ticker not in self._tickers[key]:
+                    tracer.count("articles_shared")
+                self._aliases.update({alias: key for alias in (url, digest) if alias})
+                self._tickers[key].setdefault(ticker, position)
+                unique.setdefault(key, self._articles[key])
+        return list(unique.values())
+
+    def _seen_before(self, keys):
+        """The `keys` an earlier run already saw; the rest are recorded as seen from now on."""
+        if self.history is None or not keys:
+            return set()
+        seen = {key for key, (_, age) in self.history.get_many(keys).items() if age <= self.history.ttl}
+        self.history.set_many({key: True for key in keys if key not in seen})
+        return seen
+
+    def tickers(self, article):
+        """The tickers whose searches returned `article` in this run."""
+        with self._lock:
+            return list(self._tickers.get(article.get("key"), ()))
+
+    def owner(self, article):
+        """The ticker whose search ranked `article` highest (ties by symbol), or None if it is not indexed."""
+        with self._lock:
+            ranks = self._tickers.get(article.get("key"))
+            return min(ranks, key=lambda ticker: (ranks[ticker], ticker)) if ranks else None
+
+    def novel(self, ticker, news_articles):
+        """`ticker`'s articles as its prompt should see them, with snippets only on novel content.
+
+        A shared article keeps its snippet only for its `owner`, and once `ticker` has any new
+        article, those already seen by an earlier run lose theirs. Titles are always kept. If
+        that would leave no snippet at all, the articles are returned unchanged.
+        """
+        has_new = any(article.get("new", True) for article in news_articles)
+        trimmed, repeats = [], 0
+        for article in news_articles:
+            owner = self.owner(article)
+            if article.get("snippet") and ((owner is not None and owner != ticker) or
+                                           (has_new and article.get("new") is False)):
+                article = {key: value for key, value in article.items() if key != "snippet"}
+                repeats += 1
+            trimmed.append(article)
+        if not any(article.get("snippet") for article in trimmed):
+            return news_articles
+        tracer.count("snippets_dropped", repeats)
+        return trimmed
+
+    def articles(self, tickers=None):
+        """This run's unique articles, or just those returned for any of `tickers`."""
+        with self._lock:
+            return [
+                article for key, article in self._articles.items()
+                if tickers is None or set(tickers) & set(self._tickers[key])
+            ]
+
+article_history = (
+    DiskCache(CACHE_PATH, "articles", ARTICLE_HISTORY_TTL, ARTICLE_HISTORY_MAX_ENTRIES) if ARTICLE_HISTORY_TTL else None
+)
+article_index = ArticleIndex(article_history)
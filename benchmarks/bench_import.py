@@ -0,0 +1,85 @@
+"""Startup benchmark: how long importing the CLI and running `main.py --help` take.
+
+Each measurement runs in a fresh interpreter. The benchmark also checks that importing
+`main` does not pull in any provider or model library, which must only be imported on
+first use, and exits non-zero if it does or if startup exceeds `--budget`.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 10 --budget 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that cost hundreds of milliseconds to import and are only needed once a provider is used
+HEAVY_MODULES = ("yfinance", "pandas", "numpy", "requests", "serpapi", "together", "torch", "transformers")
+
+def run(args):
+    """Runs `python <args>` in ROOT and returns (wall seconds, stderr)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + args, cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, result.stderr
+
+def import_profile():
+    """Cumulative import time in seconds of each module `main` imports directly."""
+    _, stderr = run(["-X", "importtime", "-c", "import main"])
+    # -X importtime lists each module after the ones it imports, indented two spaces per level
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            children[name.strip()] = int(cumulative) / 1e6
+        elif depth == 1:
+            if name.strip() == "main":
+                return children
+            children = {}
+    return children
+
+def heavy_imports():
+    code = f"import sys, json, main; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement (default: %(default)s)")
+    parser.add_argument("--budget", type=float, default=0.0,
+                        help="fail if the median `import main` takes longer than this many seconds")
+    args = parser.parse_args()
+
+    baseline = statistics.median(run(["-c", "pass"])[0] for _ in range(args.runs))
+    import_main = statistics.median(run(["-c", "import main"])[0] for _ in range(args.runs))
+    cli_help = statistics.median(run(["main.py", "--help"])[0] for _ in range(args.runs))
+    print(f"interpreter startup   {baseline * 1000:8.1f} ms")
+    print(f"import main           {import_main * 1000:8.1f} ms  (+{(import_main - baseline) * 1000:.1f} ms)")
+    print(f"main.py --help        {cli_help * 1000:8.1f} ms  (+{(cli_help - baseline) * 1000:.1f} ms)")
+
+    print("\nslowest direct imports of main:")
+    for name, seconds in sorted(import_profile().items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<24} {seconds * 1000:8.1f} ms")
+
+    failed = False
+    heavy = heavy_imports()
+    if heavy:
+        print(f"\nFAIL: `import main` eagerly imports {', '.join(heavy)}")
+        failed = True
+    if args.budget and import_main > args.budget:
+        print(f"\nFAIL: `import main` took {import_main:.3f}s, over the {args.budget:.3f}s budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Throughput benchmark for the local (CPU) summarization engine, in summaries per second.
+
+Summary prompts are built from synthetic articles with the same prompt builder the
+pipeline uses. Each configuration loads the model once, warms it up, then generates
+every prompt `--runs` times at each batch size. Needs torch and transformers.
+
+    python benchmarks/bench_local_summarizer.py
+    python benchmarks/bench_local_summarizer.py --prompts 16 --batch-sizes 1 4 8 16 --quantize both
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import clients  # noqa: E402,F401  (before replay, which it imports in the stand-in modes)
+from config import LOCAL_MODEL, LOCAL_MAX_INPUT_TOKENS, LOCAL_MAX_NEW_TOKENS  # noqa: E402
+from prompt_builder import build_summary_prompt  # noqa: E402
+from replay import SyntheticRegistry  # noqa: E402
+
+COMPANIES = ["Apple", "Microsoft", "Amazon", "Alphabet", "Meta", "Nvidia", "Tesla", "Broadcom",
+             "AMD", "Intel", "Qualcomm", "Micron", "Oracle", "Netflix", "Adobe", "Salesforce"]
+
+def build_prompts(count, token_budget):
+    registry = SyntheticRegistry(latency=0, error_rate=0)
+    prompts = []
+    for index in range(count):
+        company = COMPANIES[index % len(COMPANIES)]
+        articles = registry.serpapi_search({"q": f"{company} stock news"})["news_results"][:5]
+        prompts.append(build_summary_prompt(articles, company, token_budget).text)
+    return prompts
+
+def measure(summarizer, prompts, runs):
+    summarizer.generate(prompts[:1])
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        summaries = summarizer.generate(prompts)
+        timings.append(time.perf_counter() - start)
+    seconds = statistics.median(timings)
+    return {
+        "seconds": seconds,
+        "summaries_per_second": len(prompts) / seconds,
+        "empty": sum(1 for summary in summaries if not summary)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=LOCAL_MODEL)
+    parser.add_argument("--prompts", type=int, default=8, help="summaries per run (default: %(default)s)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--quantize", choices=["off", "on", "both"], default="both",
+                        help="dynamic int8 quantization (default: compare both)")
+    parser.add_argument("--max-input-tokens", type=int, default=LOCAL_MAX_INPUT_TOKENS)
+    parser.add_argument("--max-new-tokens", type=int, default=LOCAL_MAX_NEW_TOKENS)
+    parser.add_argument("--token-budget", type=int, default=600, help="prompt token budget (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    try:
+        from local_model import LocalSummarizer
+        import torch  # noqa: F401
+        import transformers  # noqa: F401
+    except ImportError as e:
+        print(f"The local summarizer needs torch and transformers: {e}")
+        sys.exit(1)
+
+    prompts = build_prompts(args.prompts, args.token_budget)
+    quantize_options = {"off": [False], "on": [True], "both": [False, True]}[args.quantize]
+    results = []
+    print("model | int8 | batch | load s | run s | summaries/s | empty")
+    for quantize in quantize_options:
+        start = time.perf_counter()
+        summarizer = LocalSummarizer(args.model, args.max_input_tokens, args.max_new_tokens,
+                                     batch_size=1, quantize=quantize, threads=args.threads)
+        load_seconds = time.perf_counter() - start
+        for batch_size in args.batch_sizes:
+            summarizer.batch_size = batch_size
+            result = dict(measure(summarizer, prompts, args.runs), model=args.model, quantize=quantize,
+                          batch_size=batch_size, load_seconds=load_seconds, prompts=len(prompts))
+            results.append(result)
+            print(f"{args.model} | {'yes' if quantize else 'no'} | {batch_size} | {load_seconds:.1f} | "
+                  f"{result['seconds']:.2f} | {result['summaries_per_second']:.2f} | {result['empty']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
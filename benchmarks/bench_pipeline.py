@@ -0,0 +1,175 @@
+"""End-to-end benchmark of the newsletter pipeline against provider stand-ins.
+
+Each pipeline mode runs in a fresh subprocess with an empty cache, so the numbers do not
+depend on what an earlier run left behind. Providers are served by `replay.py`, either
+from recorded fixtures or as synthetic responses, with optional injected latency and errors.
+A replayed run that asks for a response that was never recorded fails instead of
+reporting timings.
+
+    # record fixtures once with live credentials, through the same runs that are replayed
+    python benchmarks/bench_pipeline.py --provider-mode record --runs 1
+
+    python benchmarks/bench_pipeline.py --provider-mode replay --latency 0.3 --error-rate 0.02
+    python benchmarks/bench_pipeline.py --provider-mode synthetic --runs 5 --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+# serial: the original flow, one company at a time with a market-data request per symbol
+PIPELINE_MODES = {
+    "serial": {"max_workers": 1, "batch_market_data": False, "batch_summaries": False},
+    "concurrent": {"max_workers": 8, "batch_market_data": True, "batch_summaries": False},
+    "batched": {"max_workers": 8, "batch_market_data": True, "batch_summaries": True},
+}
+
+def run_pipeline(pipeline_mode):
+    """Runs one pipeline mode in this process and returns its measurements."""
+    settings = PIPELINE_MODES[pipeline_mode]
+    sys.path.insert(0, ROOT)
+    import clients
+    import main
+    from concurrent.futures import ThreadPoolExecutor
+    from market_data import fetch_market_data
+    from postprocess import edit_sections
+    from scheduler import scheduler
+    from tasks import iter_newsletter
+    from universe import MAGNIFICENT_SEVEN
+    # The pipeline imports pandas on first use; load it here so it stays out of the timings
+    import pandas
+
+    # Measure the run itself, not the one-off cost of importing pandas and friends
+    tracemalloc.start()
+    stages = {}
+    run_start = stage_start = time.perf_counter()
+    if settings["batch_market_data"]:
+        market_data = fetch_market_data([symbol for _, symbol in MAGNIFICENT_SEVEN.companies] + ["MAGS"])
+    else:
+        market_data = {}
+    stages["market_data"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=settings["max_workers"]) as executor:
+        build = main.build_sections_batched if settings["batch_summaries"] else main.build_sections
+        etf_intro, company_updates = build(executor, market_data)
+        company_updates = list(company_updates)
+    stages["sections"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    newsletter = "".join(edit_sections(iter_newsletter(company_updates, etf_intro), "dedup"))
+    stages["render"] = time.perf_counter() - stage_start
+
+    total = time.perf_counter() - run_start
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        "mode": pipeline_mode,
+        "total_seconds": total,
+        "stages": stages,
+        "calls": dict(getattr(clients.registry, "calls", {})),
+        "errors": sum(getattr(clients.registry, "failures", {}).values()),
+        "missing_fixtures": list(getattr(clients.registry, "missing", [])),
+        "scheduler": scheduler.stats(),
+        "peak_traced_mb": peak / 1e6,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "newsletter_chars": len(newsletter),
+    }
+
+def run_child(pipeline_mode):
+    # The pipeline reports errors on stdout; keep stdout for the result line only
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run_pipeline(pipeline_mode)
+    if result["missing_fixtures"]:
+        # Timings without the missing responses would only measure the error handling
+        print(f"{len(result['missing_fixtures'])} provider call(s) had no recorded response, "
+              f"record fixtures with --provider-mode record first:", file=sys.stderr)
+        for missing in result["missing_fixtures"][:10]:
+            print(f"  {missing}", file=sys.stderr)
+        sys.exit(1)
+    print(RESULT_MARKER + json.dumps(result))
+
+def run_once(pipeline_mode, args):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(
+            os.environ,
+            PROVIDER_MODE=args.provider_mode,
+            FIXTURES_DIR=os.path.abspath(args.fixtures),
+            REPLAY_LATENCY=str(args.latency),
+            REPLAY_ERROR_RATE=str(args.error_rate),
+            CACHE_PATH=os.path.join(cache_dir, "bench.db"),
+            PRICE_STORE_DIR=os.path.join(cache_dir, "prices"),
+        )
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", pipeline_mode],
+            env=env, cwd=ROOT, capture_output=True, text=True
+        )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Benchmark run for {pipeline_mode} failed:\n{completed.stderr[-2000:]}")
+
+def summarize(results):
+    """Median of each measurement across runs."""
+    first = results[0]
+    return {
+        "mode": first["mode"],
+        "runs": len(results),
+        "total_seconds": statistics.median(r["total_seconds"] for r in results),
+        "stages": {stage: statistics.median(r["stages"][stage] for r in results) for stage in first["stages"]},
+        "calls": {call: statistics.median(r["calls"].get(call, 0) for r in results)
+                  for call in sorted({call for r in results for call in r["calls"]})},
+        "retries": statistics.median(sum(p["retries"] for p in r["scheduler"].values()) for r in results),
+        "errors": statistics.median(r["errors"] for r in results),
+        "peak_traced_mb": statistics.median(r["peak_traced_mb"] for r in results),
+        "max_rss_mb": statistics.median(r["max_rss_mb"] for r in results),
+    }
+
+def print_report(summaries):
+    stages = list(summaries[0]["stages"])
+    header = ["mode", "total s"] + [f"{stage} s" for stage in stages] + ["calls", "retries", "errors", "peak MB", "rss MB"]
+    print(" | ".join(header))
+    for summary in summaries:
+        row = [summary["mode"], f"{summary['total_seconds']:.3f}"]
+        row += [f"{summary['stages'][stage]:.3f}" for stage in stages]
+        row += [str(int(sum(summary["calls"].values()))), str(int(summary["retries"])), str(int(summary["errors"])),
+                f"{summary['peak_traced_mb']:.1f}", f"{summary['max_rss_mb']:.1f}"]
+        print(" | ".join(row))
+    for summary in summaries:
+        calls = ", ".join(f"{call}={int(count)}" for call, count in summary["calls"].items())
+        print(f"{summary['mode']} calls: {calls}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provider-mode", choices=["replay", "synthetic", "record"], default="synthetic",
+                        help="record calls the live providers and saves their responses for replay")
+    parser.add_argument("--fixtures", default=os.path.join(ROOT, "fixtures"))
+    parser.add_argument("--latency", type=float, default=0.2, help="mean injected seconds per provider call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider calls that fail with a 503")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=list(PIPELINE_MODES), default=list(PIPELINE_MODES))
+    parser.add_argument("--output", help="write the summarized results as JSON to this file")
+    parser.add_argument("--child", choices=list(PIPELINE_MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    summaries = [summarize([run_once(mode, args) for _ in range(args.runs)]) for mode in args.modes]
+    print_report(summaries)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+
+if __name__ == "__main__":
+    main()
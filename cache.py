@@ -0,0 +1,203 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class DiskCache:
+    """SQLite-backed key/value cache with a TTL, LRU eviction and stale-while-revalidate.
+
+    Entries younger than `ttl` seconds are fresh. Entries up to `stale_ttl` seconds past
+    that are still served, while a background thread fetches a replacement. Anything older
+    is treated as a miss. Once the table holds more than `max_entries` rows, the least
+    recently read ones are dropped. Reads only note when each entry was read; those times
+    are written with the next write, just before eviction needs them, so a hit never commits.
+    """
+    def __init__(self, path, table, ttl, max_entries, stale_ttl=0):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        # Key -> when it was last read, not yet written to accessed_at
+        self._reads = {}
+        self._conn = None
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(params, exclude=("api_key",)):
+        """Builds a stable key from a dict of request params, ignoring credentials."""
+        normalized = {
+            key: value.strip().lower() if isinstance(value, str) else value
+            for key, value in params.items()
+            if key not in exclude
+        }
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_key(*parts):
+        """Builds a content-addressed key from any JSON-serializable parts."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT, created_at REAL, accessed_at REAL)"
+            )
+        return self._conn
+
+    def get(self, key):
+        """Returns (value, age_in_seconds) for a stored entry, or None."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._reads[key] = now
+            return json.loads(row[0]), now - row[1]
+
+    def get_many(self, keys):
+        """Returns {key: (value, age_in_seconds)} for the stored entries among `keys`, in one query per 500 keys."""
+        keys = list(dict.fromkeys(keys))
+        entries = {}
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                entries.update({key: (json.loads(value), now - created_at) for key, value, created_at in rows})
+            self._reads.update(dict.fromkeys(entries, now))
+        return entries
+
+    def get_fresh(self, key):
+        """Returns the stored value if it is younger than the TTL, counting it as a hit; otherwise None."""
+        entry = self.get(key)
+        if entry is None or entry[1] > self.ttl:
+            return None
+        self._count("hits")
+        return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            conn = self._connect()
+            self._write_reads(conn)
+            now = time.time()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def set_many(self, items):
+        """Stores every (key, value) pair of the dict `items` in one transaction."""
+        if not items:
+            return
+        with self._lock:
+            conn = self._connect()
+            self._write_reads(conn)
+            now = time.time()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), now, now) for key, value in items.items()]
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def flush(self):
+        """Writes the pending read times, e.g. at exit after a run that only read from the cache."""
+        with self._lock:
+            if self._reads:
+                conn = self._connect()
+                self._write_reads(conn)
+                conn.commit()
+
+    def _write_reads(self, conn):
+        if self._reads:
+            conn.executemany(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                             [(accessed_at, key) for key, accessed_at in self._reads.items()])
+            self._reads = {}
+
+    def _evict(self, conn):
+        # Drop expired rows first, then the least recently read ones over the size bound
+        expired = conn.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl - self.stale_ttl,)
+        ).rowcount
+        overflow = conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        self.evictions += expired + overflow
+
+    def get_or_fetch(self, key, fetch, should_cache=bool, max_age=None):
+        """Returns the cached value for `key`, calling `fetch()` on a miss.
+
+        Results for which `should_cache(value)` is false (by default, empty results) are
+        returned but not stored. With `max_age`, entries older than that many seconds are
+        fetched again right away instead of being served stale.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            value, age = entry
+            if age <= (self.ttl if max_age is None else min(max_age, self.ttl)):
+                self._count("hits")
+                return value
+            if max_age is None and age <= self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(key, fetch, should_cache)
+                return value
+        self._count("misses")
+        value = fetch()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _refresh_in_background(self, key, fetch, should_cache):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if should_cache(value):
+                    self.set(key, value)
+            except Exception as e:
+                print(f"Error refreshing cache entry in {self.table}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+from deadline import request_timeout
+from price_store import FIELDS as OHLCV_FIELDS
+from config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, PROVIDER_MODE
+
+SERPAPI_URL = "https://serpapi.com/search"
+TOGETHER_COMPLETIONS_URL = "https://api.together.xyz/v1/completions"
+
+PROVIDERS = ("serpapi", "yahoo", "together")
+
+class ClientRegistry:
+    """Holds one pooled, keep-alive HTTP session per provider, shared by every agent.
+
+    Sessions are created on first use. Each mounts an adapter that keeps up to `pool_size`
+    connections, so concurrent calls reuse warm TCP/TLS connections instead of opening one
+    per request. Yahoo throttles or blocks plain requests sessions, so its session is a
+    curl_cffi one impersonating Chrome, as yfinance expects. Request timeouts are capped at
+    the time left in the scheduler's current attempt, so a timed-out call actually stops.
+    requests, curl_cffi and yfinance are only imported once a provider is first called.
+    """
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, provider):
+        with self._lock:
+            if provider == "yahoo" and provider not in self._sessions:
+                from curl_cffi import requests as curl_requests
+                self._sessions[provider] = curl_requests.Session(impersonate="chrome")
+            elif provider not in self._sessions:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[provider] = session
+            return self._sessions[provider]
+
+    def yahoo_ohlcv(self, symbols, start):
+        """Downloads daily bars since `start` (YYYY-MM-DD) for several symbols in one request.
+
+        Returns {symbol: {"date": [...], "open": [...], "high", "low", "close", "volume"}} with
+        ISO dates and adjusted prices; symbols with no bars are left out.
+        """
+        import yfinance as yf
+        data = yf.download(
+            symbols, start=start, auto_adjust=True, progress=False, threads=False, session=self.session("yahoo"),
+            timeout=request_timeout(self.timeout)[1], multi_level_index=True
+        )
+        bars = {}
+        if data is None or len(data) == 0:
+            return bars
+        for symbol in symbols:
+            if symbol not in data.columns.get_level_values(1):
+                continue
+            frame = data.xs(symbol, axis=1, level=1).dropna(subset=["Close"])
+            if len(frame) == 0:
+                continue
+            bars[symbol] = {"date": [day.strftime("%Y-%m-%d") for day in frame.index]}
+            for field in OHLCV_FIELDS:
+                bars[symbol][field] = frame[field.capitalize()].fillna(0).astype(float).tolist()
+        return bars
+
+    def serpapi_search(self, search_params):
+        """Runs a SerpAPI search and returns the decoded JSON results."""
+        params = dict(search_params, output="json", source="python")
+        response = self.session("serpapi").get(SERPAPI_URL, params=params, timeout=request_timeout(self.timeout))
+        response.raise_for_status()
+        return response.json()
+
+    def together_complete(self, payload):
+        """Posts a completion request to Together and returns the decoded JSON response."""
+        response = self.session("together").post(
+            TOGETHER_COMPLETIONS_URL, json=payload, headers=self._together_headers(), timeout=request_timeout(self.timeout)
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def together_stream(self, payload):
+        """Posts a streaming completion request to Together and yields the text chunks as they arrive."""
+        with self.session("together").post(
+            TOGETHER_COMPLETIONS_URL, json=dict(payload, stream=True), headers=self._together_headers(),
+            timeout=request_timeout(self.timeout), stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                # The read timeout only bounds each chunk, so check the attempt's deadline between them
+                request_timeout(self.timeout)
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    yield choices[0].get("text", "")
+
+    def _together_headers(self):
+        return {"Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}"}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+def create_registry(mode=PROVIDER_MODE):
+    """Builds the registry for the configured provider mode: live, record, replay or synthetic."""
+    if mode == "live":
+        return ClientRegistry()
+    from replay import STAND_INS
+    return STAND_INS[mode]()
+
+registry = create_registry()
@@ -0,0 +1,171 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Number of worker threads used to build the company updates and the MAGS overview in parallel.
+# Set MAX_WORKERS=1 to run the pipeline one company at a time.
+MAX_WORKERS = max(1, int(os.getenv("MAX_WORKERS", "8")))
+
+# SQLite file backing the on-disk caches
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(".cache", "magseven.db"))
+
+# SerpAPI news cache: results are fresh for NEWS_CACHE_TTL seconds and served stale (while
+# being refreshed in the background) for NEWS_CACHE_STALE_TTL seconds after that.
+NEWS_CACHE_TTL = int(os.getenv("NEWS_CACHE_TTL", "900"))
+NEWS_CACHE_STALE_TTL = int(os.getenv("NEWS_CACHE_STALE_TTL", "3600"))
+NEWS_CACHE_MAX_ENTRIES = int(os.getenv("NEWS_CACHE_MAX_ENTRIES", "500"))
+
+# LLM completion cache, keyed by model, prompt version and input content.
+# Entries expire after SUMMARY_CACHE_TTL seconds or once SUMMARY_CACHE_MAX_ENTRIES is exceeded.
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "21600"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1000"))
+
+# News articles seen by a run are remembered for ARTICLE_HISTORY_TTL seconds (default a week),
+# so later runs can tell new articles from ones already summarized. 0 keeps no history.
+ARTICLE_HISTORY_TTL = int(os.getenv("ARTICLE_HISTORY_TTL", "604800"))
+ARTICLE_HISTORY_MAX_ENTRIES = int(os.getenv("ARTICLE_HISTORY_MAX_ENTRIES", "5000"))
+
+# Post-processing stage applied to the assembled newsletter: "dedup" removes repeated
+# summary paragraphs locally, "llm" sends each multi-paragraph summary through SummaryEditorAgent.
+NEWSLETTER_EDITOR = os.getenv("NEWSLETTER_EDITOR", "dedup")
+
+# Upper bound on the (locally estimated) tokens in one summary prompt; lower-ranked and
+# near-duplicate articles are dropped to stay within it.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "600"))
+
+# Summarization engine: "together" calls the Together API, "local" runs LOCAL_MODEL (GPT-2 by
+# default) on the CPU with no network access. The local engine generates LOCAL_BATCH_SIZE
+# prompts per call, cuts inputs to LOCAL_MAX_INPUT_TOKENS, writes at most LOCAL_MAX_NEW_TOKENS
+# and, with LOCAL_QUANTIZE, runs its linear layers as dynamic int8. LOCAL_THREADS caps torch's
+# CPU threads (0 keeps torch's default).
+SUMMARY_ENGINE = os.getenv("SUMMARY_ENGINE", "together")
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "gpt2")
+LOCAL_BATCH_SIZE = int(os.getenv("LOCAL_BATCH_SIZE", "8"))
+LOCAL_MAX_INPUT_TOKENS = int(os.getenv("LOCAL_MAX_INPUT_TOKENS", "768"))
+LOCAL_MAX_NEW_TOKENS = int(os.getenv("LOCAL_MAX_NEW_TOKENS", "120"))
+LOCAL_QUANTIZE = os.getenv("LOCAL_QUANTIZE", "false").lower() in ("1", "true", "yes")
+LOCAL_THREADS = int(os.getenv("LOCAL_THREADS", "0"))
+
+# Summarize the companies and the MAGS overview with JSON-keyed LLM requests of up to
+# BATCH_SUMMARY_SIZE sections each instead of one request per section. Companies missing
+# from a response are retried one by one. The local engine batches by default, generating
+# all the prompts together.
+BATCH_SUMMARIES = os.getenv("BATCH_SUMMARIES", "true" if SUMMARY_ENGINE == "local" else "false").lower() in (
+    "1", "true", "yes"
+)
+BATCH_SUMMARY_SIZE = max(1, int(os.getenv("BATCH_SUMMARY_SIZE", "4")))
+
+# Print each newsletter section as soon as it is ready (and consume LLM completions as
+# token streams) instead of printing the whole newsletter at the end. STREAM_SINK, if set,
+# is a file that receives the same sections as they are flushed.
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "false").lower() in ("1", "true", "yes")
+STREAM_SINK = os.getenv("STREAM_SINK", "")
+
+# Per-provider request scheduling: a token bucket refilled at <PROVIDER>_RPM requests per
+# minute and at most <PROVIDER>_MAX_CONCURRENCY calls in flight at once. Each attempt is
+# abandoned after <PROVIDER>_TIMEOUT seconds (0 for no limit). With <PROVIDER>_HEDGE_AFTER
+# set, an attempt still running after that many seconds gets a duplicate and the first
+# answer wins (0 disables hedging).
+PROVIDER_LIMITS = {
+    "serpapi": {
+        "requests_per_minute": float(os.getenv("SERPAPI_RPM", "60")),
+        "max_concurrency": int(os.getenv("SERPAPI_MAX_CONCURRENCY", "8")),
+        "timeout": float(os.getenv("SERPAPI_TIMEOUT", "20")),
+        "hedge_after": float(os.getenv("SERPAPI_HEDGE_AFTER", "0"))
+    },
+    "yahoo": {
+        "requests_per_minute": float(os.getenv("YAHOO_RPM", "120")),
+        "max_concurrency": int(os.getenv("YAHOO_MAX_CONCURRENCY", "4")),
+        "timeout": float(os.getenv("YAHOO_TIMEOUT", "20")),
+        "hedge_after": float(os.getenv("YAHOO_HEDGE_AFTER", "0"))
+    },
+    "together": {
+        "requests_per_minute": float(os.getenv("TOGETHER_RPM", "30")),
+        "max_concurrency": int(os.getenv("TOGETHER_MAX_CONCURRENCY", "4")),
+        "timeout": float(os.getenv("TOGETHER_TIMEOUT", "90")),
+        "hedge_after": float(os.getenv("TOGETHER_HEDGE_AFTER", "0"))
+    }
+}
+
+# Retries for rate-limited or transient failures, with jittered exponential backoff in seconds
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "30.0"))
+
+# Pooled HTTP sessions shared by all agents: connections kept per provider, and the
+# connect/read timeouts in seconds applied to every request.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+
+# Where provider responses come from: "live" calls the real APIs, "record" calls them and
+# saves every response under FIXTURES_DIR, "replay" serves the saved responses offline and
+# "synthetic" generates deterministic placeholder responses. The stand-in modes add
+# REPLAY_LATENCY seconds (+/-50%) per call and fail REPLAY_ERROR_RATE of calls with a 503.
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live")
+FIXTURES_DIR = os.getenv("FIXTURES_DIR", "fixtures")
+REPLAY_LATENCY = float(os.getenv("REPLAY_LATENCY", "0"))
+REPLAY_ERROR_RATE = float(os.getenv("REPLAY_ERROR_RATE", "0"))
+REPLAY_SEED = int(os.getenv("REPLAY_SEED", "0"))
+
+# Directory for the per-run JSON trace and the Prometheus metrics.prom file; empty disables export
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+
+# Ticker universe to cover: a JSON/CSV file path, or the name of a file under universes/
+UNIVERSE = os.getenv("UNIVERSE", "magnificent_seven")
+
+# Number of worker processes the universe is split across; each shard gets an equal share of
+# every provider's rate limit. Completed companies are checkpointed under CHECKPOINT_DIR.
+SHARDS = max(1, int(os.getenv("SHARDS", "1")))
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(".cache", "checkpoints"))
+
+# Symbols per yfinance download when fetching prices for a large universe
+MARKET_DATA_CHUNK_SIZE = max(1, int(os.getenv("MARKET_DATA_CHUNK_SIZE", "100")))
+
+# Local daily price history, one NumPy file per ticker under PRICE_STORE_DIR. New tickers
+# start with PRICE_HISTORY_DAYS calendar days; after that only missing days are downloaded,
+# at most once every PRICE_REFRESH_SECONDS per ticker.
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(".cache", "prices"))
+PRICE_HISTORY_DAYS = int(os.getenv("PRICE_HISTORY_DAYS", "400"))
+PRICE_REFRESH_SECONDS = int(os.getenv("PRICE_REFRESH_SECONDS", "900"))
+
+# Multi-recipient mode: each subscriber's newsletter is written to OUTPUT_DIR/<id>.md, rendered
+# by RENDER_WORKERS processes (threads for the LLM editor).
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "newsletters")
+RENDER_WORKERS = max(1, int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1))))
+
+# Extractive pre-summarizer: summary prompts keep only each company's EXTRACTIVE_SENTENCES
+# top-ranked snippet sentences (0 sends the snippets whole). When the LLM fails, or takes
+# longer than SUMMARY_DEADLINE seconds (0 waits indefinitely), the summary is made of the
+# FALLBACK_SENTENCES top-ranked sentences instead.
+EXTRACTIVE_SENTENCES = int(os.getenv("EXTRACTIVE_SENTENCES", "8"))
+FALLBACK_SENTENCES = int(os.getenv("FALLBACK_SENTENCES", "3"))
+SUMMARY_DEADLINE = float(os.getenv("SUMMARY_DEADLINE", "0"))
+
+# End-to-end publication deadline in seconds (0 for none). The budget is split into
+# consecutive stage cutoffs by SLA_STAGE_SHARES; calls that would run past their stage's
+# cutoff are cut short and the section falls back to cached or partial content, marked stale.
+SLA_SECONDS = float(os.getenv("SLA_SECONDS", "0"))
+SLA_STAGE_SHARES = os.getenv("SLA_STAGE_SHARES", "market_data=0.1,news=0.3,summarize=0.5,edit=0.1")
+
+# Service mode (`python main.py serve`): the newsletter is rebuilt every SERVICE_REFRESH_SECONDS
+# during market hours, every SERVICE_CLOSE_REFRESH_SECONDS within SERVICE_CLOSE_WINDOW minutes
+# of the close, and every SERVICE_IDLE_REFRESH_SECONDS while the market is shut. Market hours
+# are 9:30 to 16:00 on weekdays in MARKET_TIMEZONE.
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_REFRESH_SECONDS = int(os.getenv("SERVICE_REFRESH_SECONDS", "900"))
+SERVICE_CLOSE_REFRESH_SECONDS = int(os.getenv("SERVICE_CLOSE_REFRESH_SECONDS", "120"))
+SERVICE_CLOSE_WINDOW = int(os.getenv("SERVICE_CLOSE_WINDOW", "30"))
+SERVICE_IDLE_REFRESH_SECONDS = int(os.getenv("SERVICE_IDLE_REFRESH_SECONDS", "3600"))
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+
+# A recording must capture every provider call, so it never reads what earlier runs cached:
+# each recording process gets its own empty cache database and price store.
+if PROVIDER_MODE == "record":
+    import tempfile
+    _record_cache_dir = tempfile.mkdtemp(prefix="magseven-record-")
+    CACHE_PATH = os.path.join(_record_cache_dir, "magseven.db")
+    PRICE_STORE_DIR = os.path.join(_record_cache_dir, "prices")
@@ -0,0 +1,169 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from contextlib import contextmanager
+from tracing import tracer
+from config import SLA_SECONDS, SLA_STAGE_SHARES
+
+# Pipeline stages in the order they finish; each gets its share of the SLA in SLA_STAGE_SHARES
+STAGES = ("market_data", "news", "summarize", "edit")
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call runs past its timeout or its stage's share of the run's SLA."""
+
+# Opens the paragraph that marks a section as stale or partial
+STALE_MARKER = "_Stale:"
+
+# Wall-clock time (time.time()) by which the current stage must finish, or None
+_stage_deadline = contextvars.ContextVar("stage_deadline", default=None)
+# time.monotonic() by which the current provider attempt must return, or None
+_attempt_deadline = contextvars.ContextVar("attempt_deadline", default=None)
+# Notes on why the section being built is stale or partial, or None outside a section
+_stale_notes = contextvars.ContextVar("stale_notes", default=None)
+
+def parse_shares(spec):
+    """Parses "market_data=0.1,news=0.3,..." into {stage: share}, normalized to sum to 1."""
+    shares = {}
+    for item in spec.split(","):
+        if item.strip():
+            stage, share = item.split("=", 1)
+            shares[stage.strip()] = float(share)
+    unknown = set(shares) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown SLA stage(s): {', '.join(sorted(unknown))}")
+    total = sum(shares.values())
+    if total <= 0:
+        raise ValueError("SLA stage shares must add up to more than 0")
+    return {stage: shares.get(stage, 0.0) / total for stage in STAGES}
+
+class Budget:
+    """End-to-end time budget for one run, split into consecutive per-stage cutoffs.
+
+    Stage i must finish by start + seconds * (share of stages 0..i), so time a stage does
+    not use carries over to the later ones. Inside `stage(name)` every provider call is
+    capped at the time left until that cutoff. A budget of 0 seconds imposes no deadlines.
+    """
+    def __init__(self, seconds=SLA_SECONDS, shares=SLA_STAGE_SHARES):
+        self.seconds = seconds
+        self.shares = parse_shares(shares)
+        self.started = None
+
+    def start(self, seconds=None, started=None):
+        """Starts the clock; worker processes pass the coordinator's `started` to share its budget."""
+        if seconds is not None:
+            self.seconds = seconds
+        self.started = time.time() if started is None else started
+
+    @property
+    def active(self):
+        return bool(self.seconds) and self.started is not None
+
+    def cutoff(self, stage):
+        elapsed_share = 0.0
+        for name in STAGES:
+            elapsed_share += self.shares[name]
+            if name == stage:
+                break
+        return self.started + self.seconds * elapsed_share
+
+    def elapsed(self):
+        return time.time() - self.started if self.started is not None else 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """Runs the block under `name`'s cutoff (or an earlier one already in force)."""
+        if not self.active:
+            yield
+            return
+        cutoff = self.cutoff(name)
+        current = _stage_deadline.get()
+        token = _stage_deadline.set(cutoff if current is None else min(current, cutoff))
+        try:
+            yield
+        finally:
+            _stage_deadline.reset(token)
+
+budget = Budget()
+
+def remaining():
+    """Seconds left until the current stage's cutoff, or None when no deadline is in force."""
+    deadline = _stage_deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+def call_timeout(timeout=None):
+    """The tighter of `timeout` (0 or None for none) and the time left in the current stage, or None."""
+    left = remaining()
+    if not timeout:
+        return left
+    return timeout if left is None else min(timeout, left)
+
+@contextmanager
+def attempt_deadline(deadline):
+    """Runs the block with HTTP requests cut off at `deadline` (time.monotonic()), or uncapped for None."""
+    token = _attempt_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _attempt_deadline.reset(token)
+
+def request_timeout(timeout):
+    """Caps a (connect, read) `timeout` at the time left in the current provider attempt."""
+    deadline = _attempt_deadline.get()
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("no time left for the request")
+    return tuple(min(part, left) for part in timeout)
+
+def call_with_deadline(fn, timeout=None):
+    """Returns fn(), raising DeadlineExceeded once `call_timeout(timeout)` seconds have passed.
+
+    A call that misses its deadline keeps running on a daemon thread, so a late result can
+    still land in a cache for the next run without keeping this one from exiting.
+    """
+    timeout = call_timeout(timeout)
+    if timeout is None:
+        return fn()
+    if timeout <= 0:
+        raise DeadlineExceeded("no time left in the stage's budget")
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=tracer.wrap(run), daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        raise DeadlineExceeded(f"timed out after {timeout:.1f}s") from None
+
+@contextmanager
+def stale_notes():
+    """Collects the `mark_stale` notes of the section built inside the block into the yielded list."""
+    notes = []
+    token = _stale_notes.set(notes)
+    try:
+        yield notes
+    finally:
+        _stale_notes.reset(token)
+
+def mark_stale(note):
+    """Records that the section being built fell back to cached or partial content."""
+    notes = _stale_notes.get()
+    if notes is not None and note not in notes:
+        notes.append(note)
+    tracer.count("stale_content")
+
+def stale_line(notes):
+    """The marker paragraph appended to a stale section, or "" for a fresh one."""
+    return f"\n{STALE_MARKER} {'; '.join(notes)}._\n" if notes else ""
+
+def format_age(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{max(1, minutes)}m"
+    return f"{minutes // 60}h {minutes % 60}m" if minutes % 60 else f"{minutes // 60}h"
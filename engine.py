@@ -0,0 +1,267 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from agents import SummaryAgent
+from article_index import article_index
+from tools import EXTRACTIVE_NOTE, format_company_update, generate_company_update, gather_company_data
+from tasks import condensed_news, fetch_news_task, format_etf_overview, gather_etf_data, generate_etf_overview
+from market_data import fetch_market_data
+from scheduler import scheduler
+from deadline import STALE_MARKER, budget
+from tracing import tracer
+from universe import load_universe, shard
+from config import CHECKPOINT_DIR, MAX_WORKERS
+
+def isolated(build, company, symbol, *args):
+    """Runs `build(company, symbol, *args)` in the company's span, returning None on failure so the others still run."""
+    with tracer.span("company", company=company, symbol=symbol):
+        try:
+            return build(company, symbol, *args)
+        except Exception as e:
+            tracer.error(e)
+            print(f"Error generating update for {company}: {e}")
+            return None
+
+def overview_section(build, market_data, overview, *args):
+    """Runs one of the overview builders (`generate_etf_overview`, `gather_etf_data`) inside its own span."""
+    with tracer.span("company", company=overview.name, symbol=overview.symbol):
+        return build(market_data.get(overview.symbol), overview, *args)
+
+def overview_key(overview):
+    """Checkpoint key of the overview section, kept apart from the company symbols."""
+    return f"overview:{overview.symbol}"
+
+def checkpointed_overview(market_data, overview, checkpoint=None, condensed=None):
+    """Builds the overview section, reusing and recording it in `checkpoint` when one is given."""
+    key = overview_key(overview)
+    if checkpoint is not None and key in checkpoint.completed:
+        return checkpoint.completed[key]
+    etf_intro = overview_section(generate_etf_overview, market_data, overview, (condensed or {}).get(overview.symbol))
+    if etf_intro and checkpoint is not None:
+        checkpoint.record(key, etf_intro)
+    return etf_intro
+
+def summarized_sections(executor, market_data, companies, overview, summarize):
+    """Gathers the companies and the overview (if any), summarizes them in one `summarize` call and renders them.
+
+    `summarize` maps section name -> articles to (name -> summary, names whose summary fell
+    back to the extractive one). Returns (the overview section, or None without an overview,
+    and company symbol -> section in `companies` order, leaving out companies that failed).
+    """
+    overview_future = None
+    if overview:
+        overview_future = executor.submit(tracer.wrap(overview_section), gather_etf_data, market_data, overview)
+    data_futures = [
+        executor.submit(tracer.wrap(isolated), gather_company_data, company, symbol, market_data.get(symbol))
+        for company, symbol in companies
+    ]
+    company_data = [data for data in (future.result() for future in data_futures) if data]
+
+    # Every search is done by now, so each article's snippet goes to one company at most
+    company_articles = {}
+    if overview_future:
+        etf_data, overview_news, overview_stale = overview_future.result()
+        company_articles[overview.name] = article_index.novel(overview.symbol, overview_news)
+    company_articles.update({
+        data["company_name"]: article_index.novel(data["stock_symbol"], data["news_articles"]) for data in company_data
+    })
+    with tracer.span("summarize", companies=len(company_articles)), budget.stage("summarize"):
+        summaries, fallbacks = summarize(company_articles)
+
+    sections = {}
+    for data in company_data:
+        if data["company_name"] in fallbacks:
+            data["stale"].append(EXTRACTIVE_NOTE)
+        sections[data["stock_symbol"]] = format_company_update(data, summaries[data["company_name"]])
+    if not overview_future:
+        return None, sections
+    if overview.name in fallbacks:
+        overview_stale.append(EXTRACTIVE_NOTE)
+    return format_etf_overview(etf_data, summaries[overview.name], overview, overview_stale), sections
+
+def summarize_batch(company_articles):
+    """Summarizes the sections in batched requests; returns (summaries, names that fell back)."""
+    summary_agent = SummaryAgent()
+    return summary_agent.summarize_batch(company_articles), summary_agent.fallbacks
+
+def batched_sections(executor, market_data, universe, checkpoint=None):
+    """Builds the overview and the universe's company sections with batched summaries.
+
+    Sections finished in `checkpoint` are reused and new ones recorded there. Returns
+    (etf_intro, {symbol: section}); failed companies are left out of the dict.
+    """
+    # A finished overview from an earlier attempt of this run is reused rather than summarized again
+    resumed_overview = bool(universe.overview) and checkpoint is not None and \
+        overview_key(universe.overview) in checkpoint.completed
+    etf_intro, sections = summarized_sections(
+        executor, market_data, pending_companies(universe.companies, checkpoint),
+        None if resumed_overview else universe.overview, summarize_batch
+    )
+
+    updates = {company.symbol: checkpoint.completed[company.symbol] for company in universe.companies
+               if checkpoint is not None and company.symbol in checkpoint.completed}
+    updates.update(sections)
+    if checkpoint:
+        for symbol, company_update in sections.items():
+            checkpoint.record(symbol, company_update)
+    if resumed_overview:
+        return checkpointed_overview(market_data, universe.overview, checkpoint), updates
+    if etf_intro and checkpoint:
+        checkpoint.record(overview_key(universe.overview), etf_intro)
+    return etf_intro or "", updates
+
+def new_run_id(universe):
+    return f"{universe.key}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+def finished_section(update):
+    """Whether a section can be reused on resume: it has its price and nothing was left out or reused."""
+    return bool(update) and not any(
+        marker in update for marker in ("Could not retrieve data", "Closing Price: unavailable", STALE_MARKER)
+    )
+
+class Checkpoint:
+    """Durable record of the company updates a run has finished, so a crashed run can resume.
+
+    Each process appends to its own JSON-lines file under CHECKPOINT_DIR/<run_id>/. Loading
+    reads every file there, so a run may be resumed with a different shard count. Only
+    finished sections count as `completed`; failed, price-less or stale ones are kept in
+    `sections` for the run that built them and are retried on resume.
+    """
+    def __init__(self, run_id, name="main", directory=CHECKPOINT_DIR):
+        self.run_id = run_id
+        self.directory = os.path.join(directory, run_id)
+        self.path = os.path.join(self.directory, f"{name}.jsonl")
+        self._lock = threading.Lock()
+        self.sections = self.load()
+        self.completed = {symbol: update for symbol, update in self.sections.items() if finished_section(update)}
+        # Terminate a line left half-written by a crash so the next record starts cleanly
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def load(self):
+        completed = {}
+        if not os.path.isdir(self.directory):
+            return completed
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".jsonl"):
+                continue
+            with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    completed[entry["symbol"]] = entry["update"]
+        return completed
+
+    def record(self, symbol, update):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"symbol": symbol, "update": update}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.sections[symbol] = update
+            if finished_section(update):
+                self.completed[symbol] = update
+            else:
+                self.completed.pop(symbol, None)
+
+def pending_companies(companies, checkpoint=None):
+    """The companies that still need an update, i.e. are not in `checkpoint`."""
+    if checkpoint is None:
+        return list(companies)
+    return [company for company in companies if company.symbol not in checkpoint.completed]
+
+def checkpointed_update(company, market_data, checkpoint, prompt_articles=None):
+    update = isolated(generate_company_update, company.name, company.symbol, market_data, prompt_articles)
+    if update and checkpoint is not None:
+        checkpoint.record(company.symbol, update)
+    return update
+
+def submit_company_updates(executor, companies, market_data, checkpoint=None, condensed=None):
+    """Submits every company not already in `checkpoint` to `executor`, once per symbol.
+
+    Returns {symbol: future}; checkpointed updates come back as already-resolved futures.
+    New updates are recorded in `checkpoint` as soon as they finish. `condensed` is the
+    `tasks.condensed_news` for the companies, if they were condensed together.
+    """
+    condensed = condensed or {}
+    completed = dict(checkpoint.completed) if checkpoint else {}
+    futures = {}
+    for company in companies:
+        if company.symbol in futures:
+            continue
+        if company.symbol in completed:
+            futures[company.symbol] = Future()
+            futures[company.symbol].set_result(completed[company.symbol])
+        else:
+            futures[company.symbol] = executor.submit(
+                tracer.wrap(checkpointed_update), company, market_data.get(company.symbol), checkpoint,
+                condensed.get(company.symbol)
+            )
+    return futures
+
+def iter_company_updates(executor, companies, market_data, checkpoint=None, condensed=None):
+    """Submits every pending company to `executor` and returns a generator of the updates.
+
+    The generator yields in `companies` order, each update as soon as it and the ones before
+    it are ready. Failed companies are left out.
+    """
+    futures = submit_company_updates(executor, companies, market_data, checkpoint, condensed)
+
+    def iter_updates():
+        for company in companies:
+            company_update = futures[company.symbol].result()
+            if company_update:
+                yield company_update
+    return iter_updates()
+
+def run_shard(universe_path, shard_index, shard_count, run_id, max_workers=MAX_WORKERS, sla=(0, None)):
+    """Worker-process entry point: builds one shard's company updates into the run's checkpoint.
+
+    `sla` is the coordinator's (seconds, start time), so every shard works to the same deadline.
+    Returns the number of companies this shard built (those already checkpointed are skipped).
+    """
+    universe = load_universe(universe_path)
+    budget.start(*sla)
+    # Every shard plus the coordinating process share the providers' rate limits
+    scheduler.share(shard_count + 1)
+    checkpoint = Checkpoint(run_id, f"shard-{shard_index + 1}-of-{shard_count}")
+    companies = pending_companies(shard(universe.companies, shard_index, shard_count), checkpoint)
+    with budget.stage("market_data"):
+        market_data = fetch_market_data([company.symbol for company in companies])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        shard_universe = universe._replace(companies=companies, overview=None)
+        fetch_news_task(shard_universe, executor)
+        condensed = condensed_news(shard_universe)
+        return sum(1 for _ in iter_company_updates(executor, companies, market_data, checkpoint, condensed))
+
+def run_sharded(universe, shard_count, run_id, max_workers=MAX_WORKERS):
+    """Builds the universe's company updates across `shard_count` worker processes.
+
+    Shards write their results to the run's checkpoint, which is then merged back into one
+    list in universe order. A shard that crashes loses none of the companies it finished.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=shard_count, mp_context=context) as pool:
+        futures = [
+            pool.submit(run_shard, universe.path, shard_index, shard_count, run_id, max_workers,
+                        (budget.seconds, budget.started))
+            for shard_index in range(shard_count)
+        ]
+        for shard_index, future in enumerate(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error in shard {shard_index + 1} of {shard_count}: {e}")
+
+    # Degraded sections are not reused on resume, but still belong in this run's newsletter
+    sections = Checkpoint(run_id).sections
+    return [sections[company.symbol] for company in universe.companies if company.symbol in sections]
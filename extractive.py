@@ -0,0 +1,153 @@
+import re
+from collections import namedtuple
+from similarity import words, shingles, jaccard
+from config import EXTRACTIVE_SENTENCES
+
+# Words too common in financial news to say anything about one company's day
+STOP_WORDS = frozenset("""
+a about after against all also an and are as at be been before but by can could did do does for from had has
+have he her his how i if in into is it its just more most new no not now of on or our out over said says she so
+than that the their them then there these they this those to up was we were what when which while who will with
+would you your stock stocks shares share market markets company
+""".split())
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9$\"'])")
+
+# Companies scored per matrix; bounds memory for very large universes
+CHUNK_COMPANIES = 64
+
+# `article` indexes the company's news_results, `field` is "title" or "snippet" and
+# `position` is the sentence's place in reading order across all of the company's articles
+Sentence = namedtuple("Sentence", ["text", "article", "field", "position", "score"])
+
+def split_sentences(text):
+    """Splits a title or snippet into sentences, dropping a trailing fragment cut off with an ellipsis."""
+    sentences = [sentence.strip() for sentence in _SENTENCE_END.split(text.strip()) if sentence.strip()]
+    if len(sentences) > 1 and sentences[-1].endswith(("...", "…")):
+        sentences.pop()
+    return sentences
+
+def article_sentences(news_articles):
+    """Returns (sentence, article index, field) for every title and snippet sentence, in article order."""
+    sentences = []
+    for index, article in enumerate(news_articles):
+        for field in ("title", "snippet"):
+            for sentence in split_sentences(article.get(field) or ""):
+                sentences.append((sentence, index, field))
+    return sentences
+
+def terms(sentence):
+    return [word for word in words(sentence) if word not in STOP_WORDS and len(word) > 1]
+
+def rank_sentences(company_articles, damping=0.85, iterations=20):
+    """Scores every article sentence of every company (company name -> news_results dicts) at once.
+
+    Sentences become TF-IDF vectors, with IDF taken over all companies' sentences so words
+    common to the whole day's news count for little. Within each company, sentences are
+    ranked TextRank-style by PageRank over their cosine-similarity graph, with every
+    company's graph stacked into one array so each power-iteration step is a single batched
+    matrix product. Returns company name -> list of Sentence, highest score first.
+    """
+    import numpy as np
+
+    company_sentences = {company: article_sentences(articles) for company, articles in company_articles.items()}
+    tokenized = {company: [terms(sentence[0]) for sentence in sentences] for company, sentences in company_sentences.items()}
+
+    vocabulary, document_frequency = {}, []
+    for company_terms in tokenized.values():
+        for sentence_terms in company_terms:
+            for term in set(sentence_terms):
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+                    document_frequency.append(0)
+                document_frequency[vocabulary[term]] += 1
+    sentence_count = sum(len(company_terms) for company_terms in tokenized.values())
+    idf = np.log((1 + sentence_count) / (1 + np.array(document_frequency, dtype=np.float32))) + 1
+
+    ranked = {company: [] for company in company_articles}
+    companies = [company for company in company_articles if company_sentences[company]]
+    for start in range(0, len(companies), CHUNK_COMPANIES):
+        chunk = companies[start:start + CHUNK_COMPANIES]
+        # Each company gets its own columns for just its own terms; vectors[c, i] is sentence
+        # i of company c, with rows past the company's sentence count left as zeros
+        index, widest = [], 1
+        for c, company in enumerate(chunk):
+            company_columns = {}
+            for i, sentence_terms in enumerate(tokenized[company]):
+                for term in sentence_terms:
+                    index.append((c, i, company_columns.setdefault(term, len(company_columns)), vocabulary[term]))
+            widest = max(widest, len(company_columns))
+        sizes = np.array([len(tokenized[company]) for company in chunk])
+        vectors = np.zeros((len(chunk), sizes.max(), widest), dtype=np.float32)
+        if index:
+            c, i, column, term = np.array(index).T
+            np.add.at(vectors, (c, i, column), idf[term])
+        norms = np.linalg.norm(vectors, axis=2, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+        # Cosine similarity between every pair of a company's sentences, without self-loops
+        similarity = vectors @ vectors.transpose(0, 2, 1)
+        diagonal = np.arange(similarity.shape[1])
+        similarity[:, diagonal, diagonal] = 0
+        degree = similarity.sum(axis=2)
+        degree[degree <= 1e-6] = np.inf
+
+        present = diagonal[None, :] < sizes[:, None]
+        teleport = np.where(present, (1 - damping) / sizes[:, None], 0).astype(np.float32)
+        scores = present / sizes[:, None].astype(np.float32)
+        for _ in range(iterations):
+            scores = teleport + damping * ((scores / degree)[:, None, :] @ similarity)[:, 0, :]
+        # Break ties towards earlier (more relevant) articles, and titles before snippets
+        scores = scores - diagonal * 1e-6
+
+        for c, company in enumerate(chunk):
+            company_scores = scores[c, :sizes[c]]
+            ranked[company] = [
+                Sentence(*company_sentences[company][i], int(i), float(company_scores[i]))
+                for i in np.argsort(-company_scores, kind="stable")
+            ]
+    return ranked
+
+def top_sentences(ranked, count, threshold=0.6):
+    """The best `count` sentences, skipping near-duplicates of ones already chosen, in reading order."""
+    chosen = []
+    for sentence in ranked:
+        sentence_shingles = shingles(sentence.text, size=2)
+        if any(jaccard(sentence_shingles, shingles(previous.text, size=2)) >= threshold for previous in chosen):
+            continue
+        chosen.append(sentence)
+        if len(chosen) == count:
+            break
+    return sorted(chosen, key=lambda sentence: sentence.position)
+
+def condense_articles(company_articles, sentences=EXTRACTIVE_SENTENCES):
+    """Trims every company's snippets (company name -> news_results dicts) down to its top sentences.
+
+    Only the `sentences` best-ranked snippet sentences per company are kept, each in its own
+    article; titles are left alone and articles with nothing selected keep just their title.
+    Returns company name -> condensed articles, in the original order.
+    """
+    ranked = rank_sentences(company_articles)
+    condensed = {}
+    for company, articles in company_articles.items():
+        snippets = [sentence for sentence in ranked[company] if sentence.field == "snippet"]
+        selected = {}
+        for sentence in top_sentences(snippets, sentences):
+            selected.setdefault(sentence.article, []).append(sentence.text)
+        condensed[company] = [
+            dict(article, snippet=" ".join(selected[index])) if index in selected
+            else {key: value for key, value in article.items() if key != "snippet"}
+            for index, article in enumerate(articles)
+        ]
+    return condensed
+
+def extractive_summaries(company_articles, sentences=3):
+    """Builds a summary for every company from its top-ranked sentences, with no LLM involved."""
+    ranked = rank_sentences(company_articles)
+    summaries = {}
+    for company, company_ranked in ranked.items():
+        chosen = top_sentences(company_ranked, sentences)
+        text = " ".join(sentence.text if sentence.text.endswith((".", "!", "?")) else sentence.text + "."
+                        for sentence in chosen)
+        summaries[company] = text or "No significant news to summarize."
+    return summaries
@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from deadline import budget
+from engine import batched_sections, checkpointed_overview, pending_companies, submit_company_updates
+from market_data import fetch_market_data
+from postprocess import EDITORS, edit_sections
+from tasks import condensed_news, fetch_news_task, iter_newsletter
+from tracing import tracer
+from universe import Company
+from config import MAX_WORKERS, NEWSLETTER_EDITOR, BATCH_SUMMARIES, RENDER_WORKERS
+
+# Rendering takes tens of microseconds per newsletter while a spawned worker takes about a
+# second to start, so worker processes are only used for at least this many subscribers each
+MIN_SUBSCRIBERS_PER_PROCESS = 5000
+
+Subscriber = namedtuple("Subscriber", ["id", "name", "watchlist"])
+
+def load_subscribers(path):
+    """Loads subscribers from a JSON list of {"id", "name" (optional), "watchlist": [symbols]}."""
+    with open(path, encoding="utf-8") as f:
+        rows = json.load(f)
+    subscribers = []
+    for row in rows:
+        watchlist = [symbol.strip().upper() for symbol in row.get("watchlist", []) if symbol.strip()]
+        subscribers.append(Subscriber(str(row["id"]), row.get("name") or "Investors", list(dict.fromkeys(watchlist))))
+    return subscribers
+
+def watchlist_companies(subscribers, universe):
+    """The distinct companies on any watchlist: universe companies in universe order, then any
+    symbol the universe does not list (named by its symbol) in the order first seen."""
+    wanted = {symbol for subscriber in subscribers for symbol in subscriber.watchlist}
+    companies = [company for company in universe.companies if company.symbol in wanted]
+    known = {company.symbol for company in companies}
+    for subscriber in subscribers:
+        for symbol in subscriber.watchlist:
+            if symbol not in known:
+                known.add(symbol)
+                companies.append(Company(symbol, symbol))
+    return companies
+
+def build_shared_sections(companies, universe, max_workers=MAX_WORKERS, checkpoint=None,
+                          batch_summaries=BATCH_SUMMARIES):
+    """Builds the overview and one update per distinct company, each exactly once.
+
+    Returns (etf_intro, {symbol: update}); failed companies are left out of the dict.
+    """
+    with tracer.span("market_data"), budget.stage("market_data"):
+        symbols = [company.symbol for company in pending_companies(companies, checkpoint)]
+        if universe.overview:
+            symbols.append(universe.overview.symbol)
+        market_data = fetch_market_data(symbols)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if batch_summaries:
+            return batched_sections(executor, market_data, universe._replace(companies=companies), checkpoint)
+        news_universe = universe._replace(companies=pending_companies(companies, checkpoint))
+        fetch_news_task(news_universe, executor)
+        condensed = condensed_news(news_universe)
+        overview_future = None
+        if universe.overview:
+            overview_future = executor.submit(
+                tracer.wrap(checkpointed_overview), market_data, universe.overview, checkpoint, condensed
+            )
+        futures = submit_company_updates(executor, companies, market_data, checkpoint, condensed)
+        updates = {symbol: future.result() for symbol, future in futures.items()}
+        etf_intro = overview_future.result() if overview_future else ""
+    return etf_intro, {symbol: update for symbol, update in updates.items() if update}
+
+def recipient_filename(subscriber_id):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", subscriber_id).strip("._") or "subscriber"
+
+# Shared sections handed to each render worker once, rather than with every subscriber
+_render_state = {}
+
+def init_renderer(universe, etf_intro, updates, editor, output_dir):
+    _render_state.update(universe=universe, etf_intro=etf_intro, updates=updates, editor=editor,
+                         output_dir=output_dir)
+
+def render_newsletter(subscriber):
+    """Assembles one subscriber's newsletter from the shared sections and writes it to its file."""
+    state = _render_state
+    company_updates = [state["updates"][symbol] for symbol in subscriber.watchlist if symbol in state["updates"]]
+    sections = iter_newsletter(company_updates, state["etf_intro"], state["universe"], subscriber.name)
+    newsletter = "".join(edit_sections(sections, state["editor"], report=False))
+    path = os.path.join(state["output_dir"], f"{recipient_filename(subscriber.id)}.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(newsletter)
+    return path
+
+def render_newsletters(subscribers, universe, etf_intro, updates, output_dir, editor=NEWSLETTER_EDITOR,
+                       workers=RENDER_WORKERS):
+    """Renders every subscriber's newsletter in parallel and returns the written paths, in subscriber order.
+
+    The LLM editor renders on threads, so its requests stay under this process's scheduler.
+    Local editors render in up to `workers` processes, given enough subscribers to pay for
+    starting them.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = (universe, etf_intro, updates, editor, output_dir)
+    editor_class = EDITORS.get(editor)
+    if editor_class is not None and not editor_class.streaming and workers > 1:
+        init_renderer(*state)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(tracer.wrap(render_newsletter), subscriber) for subscriber in subscribers]
+            return [future.result() for future in futures]
+
+    workers = min(workers, len(subscribers) // MIN_SUBSCRIBERS_PER_PROCESS)
+    if workers <= 1:
+        init_renderer(*state)
+        return [render_newsletter(subscriber) for subscriber in subscribers]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_renderer,
+                             initargs=state) as pool:
+        return list(pool.map(render_newsletter, subscribers, chunksize=max(1, len(subscribers) // (workers * 4))))
+
+def generate_newsletters(subscribers, universe, output_dir, max_workers=MAX_WORKERS, editor=NEWSLETTER_EDITOR,
+                         checkpoint=None, batch_summaries=BATCH_SUMMARIES):
+    """Generates one newsletter per subscriber.
+
+    Market data, news and summaries are computed once per distinct ticker across all
+    watchlists, so the cost grows with the number of tickers rather than subscribers.
+    """
+    companies = watchlist_companies(subscribers, universe)
+    etf_intro, updates = build_shared_sections(companies, universe, max_workers, checkpoint, batch_summaries)
+    with tracer.span("render", editor=editor, subscribers=len(subscribers)), budget.stage("edit"):
+        return render_newsletters(subscribers, universe, etf_intro, updates, output_dir, editor)
@@ -0,0 +1,122 @@
+import threading
+from tracing import tracer
+from config import (
+    LOCAL_MODEL, LOCAL_MAX_INPUT_TOKENS, LOCAL_MAX_NEW_TOKENS, LOCAL_BATCH_SIZE, LOCAL_QUANTIZE, LOCAL_THREADS
+)
+
+# torch and transformers are imported when the model is first loaded, so selecting the
+# Together engine never pays for them.
+
+# Base models continue text rather than follow instructions, so every prompt ends on a cue
+SUMMARY_CUE = "\n\nSummary:"
+
+def quantize_dynamic_int8(model):
+    """Returns `model` with every linear layer quantized to dynamic int8.
+
+    torch's dynamic quantization only handles nn.Linear, while GPT-2 implements its attention
+    and MLP projections as transformers' Conv1D (a linear layer with a transposed weight), so
+    those are converted to nn.Linear first.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def clean_completion(text):
+    """Keeps the first paragraph of a completion, without a trailing unfinished sentence."""
+    text = text.strip().split("\n\n")[0].strip()
+    end = max(text.rfind(". "), text.rfind(".\n"), len(text) - 1 if text.endswith(".") else -1)
+    return text[:end + 1].strip() if end > 0 else text
+
+class LocalSummarizer:
+    """GPT-2 (or another causal language model) generating summaries on the CPU, no network needed.
+
+    Prompts run in left-padded batches of up to `batch_size`, one `generate` call per batch,
+    sorted by length so each batch carries little padding. Each prompt gets a closing
+    "Summary:" cue and is cut to `max_input_tokens` from the left, so the cue survives.
+    Decoding is greedy, so a prompt always gets the same summary. With `quantize`, the
+    linear layers run as dynamic int8.
+    """
+    def __init__(self, model_name=LOCAL_MODEL, max_input_tokens=LOCAL_MAX_INPUT_TOKENS,
+                 max_new_tokens=LOCAL_MAX_NEW_TOKENS, batch_size=LOCAL_BATCH_SIZE, quantize=LOCAL_QUANTIZE,
+                 threads=LOCAL_THREADS):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.tokenizer.padding_side = "left"
+        self.tokenizer.truncation_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+        model.eval()
+        self.model = quantize_dynamic_int8(model) if quantize else model
+
+        context = getattr(model.config, "n_positions", None) or getattr(model.config, "max_position_embeddings", 1024)
+        self.max_new_tokens = max_new_tokens
+        self.max_input_tokens = min(max_input_tokens, context - max_new_tokens)
+        self.batch_size = max(1, batch_size)
+        # One generate call at a time; torch already spreads each call over the CPU cores
+        self._lock = threading.Lock()
+
+    def generate(self, prompts):
+        """Returns one cleaned completion per prompt, in the order given."""
+        order = sorted(range(len(prompts)), key=lambda index: len(prompts[index]))
+        completions = [None] * len(prompts)
+        with self._lock:
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                batch_prompts = [prompts[index].rstrip() + SUMMARY_CUE for index in batch]
+                for index, text in zip(batch, self._generate_batch(batch_prompts)):
+                    completions[index] = text
+        return completions
+
+    def _generate_batch(self, prompts):
+        inputs = self.tokenizer(
+            prompts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_input_tokens
+        )
+        with tracer.span("llm", engine="local", batch_size=len(prompts)):
+            with self.torch.inference_mode():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=self.max_new_tokens,
+                    do_sample=False,
+                    no_repeat_ngram_size=3,
+                    pad_token_id=self.tokenizer.pad_token_id
+                )
+            # With left padding every prompt ends at the same column; the rest is the completion
+            new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+            prompt_tokens = int(inputs["attention_mask"].sum())
+            completion_tokens = int((new_tokens != self.tokenizer.pad_token_id).sum())
+            tracer.annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            tracer.count("llm_prompt_tokens", prompt_tokens)
+            tracer.count("llm_completion_tokens", completion_tokens)
+            tracer.count("llm_requests")
+        return [clean_completion(text) for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+def local_model_id(model_name=LOCAL_MODEL, quantize=LOCAL_QUANTIZE, max_input_tokens=LOCAL_MAX_INPUT_TOKENS,
+                   max_new_tokens=LOCAL_MAX_NEW_TOKENS):
+    """Identifies the local model setup in summary cache keys, including the input and output caps."""
+    return f"local:{model_name}:{'int8' if quantize else 'fp32'}:{max_input_tokens}:{max_new_tokens}"
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+def local_summarizer():
+    """The process-wide LocalSummarizer, loaded once on first use and shared by every agent."""
+    global _summarizer
+    with _summarizer_lock:
+        if _summarizer is None:
+            _summarizer = LocalSummarizer()
+        return _summarizer
@@ -1,39 +1,295 @@
-from agents import StockDataAgent, NewsAgent, SummaryAgent, SummaryEditorAgent
-from tasks import fetch_news_task, generate_newsletter
+import argparse
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from agents import news_cache, summary_cache
+from article_index import article_history, article_index
+from tasks import condensed_news, fetch_news_task, iter_newsletter
 from tools import generate_company_update
-from dotenv import load_dotenv
-
-# Load environment variables (API keys)
-load_dotenv()
-
-def main():
-    print("Gathering latest news on the Magnificent Seven stocks...\n")
-
-    all_updates = []
-    for company, symbol in [
-        ("Apple", "AAPL"),
-        ("Microsoft", "MSFT"),
-        ("Amazon", "AMZN"),
-        ("Alphabet", "GOOGL"),
-        ("Meta", "META"),
-        ("Nvidia", "NVDA"),
-        ("Tesla", "TSLA")
-    ]:
-        try:
-            company_update = generate_company_update(company, symbol)
-            if company_update:
-                all_updates.append(company_update)
-        except Exception as e:
-            print(f"Error generating update for {company}: {e}")
+from fanout import generate_newsletters, load_subscribers, render_newsletters
+from engine import (
+    Checkpoint, batched_sections, checkpointed_overview, isolated, iter_company_updates, new_run_id, overview_key,
+    pending_companies, run_sharded
+)
+from market_data import fetch_market_data
+from deadline import budget
+from postprocess import edit_sections
+from scheduler import scheduler
+from tracing import tracer
+from universe import MAGNIFICENT_SEVEN, load_universe
+from config import (
+    MAX_WORKERS, NEWSLETTER_EDITOR, BATCH_SUMMARIES, STREAM_OUTPUT, STREAM_SINK, TRACE_DIR, UNIVERSE, SHARDS,
+    OUTPUT_DIR, SLA_SECONDS, SERVICE_HOST, SERVICE_PORT
+)
 
+def submit_overview(executor, market_data, overview, checkpoint=None, condensed=None):
+    """Submits the overview section, if the universe has one; the future resolves to its section."""
+    if overview is None:
+        return None
+    return executor.submit(tracer.wrap(checkpointed_overview), market_data, overview, checkpoint, condensed)
+
+def build_sections(executor, market_data, universe=MAGNIFICENT_SEVEN, checkpoint=None):
+    """Builds the overview and the company updates, one summary request per section.
+
+    Returns at once, so the newsletter header can be flushed first: the overview as a
+    callable and the company updates as a generator that yields each one, in order, as soon
+    as it is ready. Whichever is used first starts the work.
+    """
+    started = {}
+
+    def start():
+        if not started:
+            # Search everything first, so each prompt can leave out what another one already covers,
+            # and condense it all together, so sentence weights reflect the whole universe's news
+            news_universe = universe._replace(companies=pending_companies(universe.companies, checkpoint))
+            fetch_news_task(news_universe, executor)
+            condensed = condensed_news(news_universe)
+            started["overview"] = submit_overview(executor, market_data, universe.overview, checkpoint, condensed)
+            started["updates"] = iter_company_updates(executor, universe.companies, market_data, checkpoint, condensed)
+        return started
+
+    def overview():
+        future = start()["overview"]
+        return future.result() if future else ""
+
+    def company_updates():
+        yield from start()["updates"]
+    return overview, company_updates()
+
+def build_sections_batched(executor, market_data, universe=MAGNIFICENT_SEVEN, checkpoint=None):
+    """Builds the same sections, but summarizes every company and the overview in batched requests."""
+    etf_intro, updates = batched_sections(executor, market_data, universe, checkpoint)
+    return etf_intro, [updates[company.symbol] for company in universe.companies if company.symbol in updates]
+
+def build_sections_sharded(executor, market_data, universe, shard_count, checkpoint, max_workers=MAX_WORKERS):
+    """Builds the overview in this process while `shard_count` worker processes build the companies."""
+    scheduler.share(shard_count + 1)
+    overview_future = submit_overview(executor, market_data, universe.overview, checkpoint)
+    company_updates = run_sharded(universe, shard_count, checkpoint.run_id, max_workers)
+    return (overview_future.result() if overview_future else ""), company_updates
+
+def stream_sections(sections, sink_path=STREAM_SINK):
+    """Writes each section to stdout (and the sink file, if any) as soon as it is produced."""
+    sink = open(sink_path, "w", encoding="utf-8") if sink_path else None
     try:
-        newsletter_content = generate_newsletter(all_updates)
-        editor_agent = SummaryEditorAgent()
-        refined_newsletter = editor_agent.remove_extra_summary(newsletter_content)
+        for section in sections:
+            sys.stdout.write(section)
+            sys.stdout.flush()
+            if sink:
+                sink.write(section)
+                sink.flush()
+        # Match the trailing newline print() adds in the buffered path
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+    finally:
+        if sink:
+            sink.close()
+
+def collect_metrics():
+    """Snapshots cache and provider scheduler statistics as labelled gauges for the metrics export."""
+    metrics = defaultdict(list)
+    caches = [("news", news_cache), ("summaries", summary_cache)]
+    if article_history:
+        caches.append(("articles", article_history))
+    for cache_name, cache in caches:
+        for stat, value in cache.stats().items():
+            metrics[f"cache_{stat}"].append(({"cache": cache_name}, value))
+    for provider, stats in scheduler.stats().items():
+        for stat, value in stats.items():
+            metrics[f"provider_{stat}"].append(({"provider": provider}, value))
+    return dict(metrics)
+
+def report_sla():
+    """Prints how much of the run's SLA was used, if it has one."""
+    if budget.active:
+        print(f"Finished in {budget.elapsed():.1f}s of the {budget.seconds:g}s SLA", file=sys.stderr)
+
+def main(max_workers=MAX_WORKERS, editor=NEWSLETTER_EDITOR, batch_summaries=BATCH_SUMMARIES, stream=STREAM_OUTPUT,
+         trace_dir=TRACE_DIR, universe=UNIVERSE, shards=SHARDS, run_id=None, subscribers=None, output_dir=OUTPUT_DIR,
+         sla=SLA_SECONDS):
+    universe = load_universe(universe)
+    print(f"Gathering latest news on the {universe.name} stocks...\n")
+    tracer.start_run()
+    article_index.start_run()
+    budget.start(sla)
+
+    if subscribers and shards > 1:
+        print("--shards is ignored with --subscribers; the shared sections are built in this process", file=sys.stderr)
+        shards = 1
+    # Sharded runs always checkpoint, since the shards hand their results back through it
+    if shards > 1 and not run_id:
+        run_id = new_run_id(universe)
+    checkpoint = Checkpoint(run_id) if run_id else None
+    if checkpoint:
+        done = sum(1 for company in universe.companies if company.symbol in checkpoint.completed)
+        print(f"Checkpointing run {run_id}: {done} of {len(universe.companies)} "
+              f"companies already done", file=sys.stderr)
+    if shards > 1 and batch_summaries:
+        print("BATCH_SUMMARIES is ignored for sharded runs; each company is summarized on its own", file=sys.stderr)
+
+    if subscribers:
+        subscribers = load_subscribers(subscribers)
+        with tracer.span("run", max_workers=max_workers, universe=universe.key, subscribers=len(subscribers)):
+            paths = generate_newsletters(subscribers, universe, output_dir, max_workers, editor, checkpoint,
+                                         batch_summaries)
+        print(f"Wrote {len(paths)} newsletters to {output_dir}")
+        report_sla()
+        if trace_dir:
+            print(f"Wrote trace to {tracer.export(trace_dir, collect_metrics())}", file=sys.stderr)
+        return
+
+    with tracer.span("run", max_workers=max_workers, batch_summaries=batch_summaries, stream=stream,
+                     universe=universe.key, companies=len(universe.companies), shards=shards, sla=sla):
+        # Batched downloads cover every pending company (each shard fetches its own) plus the overview ETF
+        with tracer.span("market_data"), budget.stage("market_data"):
+            symbols = [] if shards > 1 else [company.symbol for company in pending_companies(universe.companies, checkpoint)]
+            if universe.overview:
+                symbols.append(universe.overview.symbol)
+            market_data = fetch_market_data(symbols)
+
+        # Fan the overview and every company out over the pool; results are collected
+        # in universe order so the newsletter layout never depends on timing.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                if shards > 1:
+                    etf_intro, company_updates = build_sections_sharded(
+                        executor, market_data, universe, shards, checkpoint, max_workers
+                    )
+                elif batch_summaries:
+                    etf_intro, company_updates = build_sections_batched(executor, market_data, universe, checkpoint)
+                else:
+                    etf_intro, company_updates = build_sections(executor, market_data, universe, checkpoint)
+
+                with tracer.span("render", editor=editor), budget.stage("edit"):
+                    sections = edit_sections(iter_newsletter(company_updates, etf_intro, universe), editor)
+                    if stream:
+                        stream_sections(sections)
+                    else:
+                        print("".join(sections))
+            except Exception as e:
+                tracer.error(e, stage="newsletter")
+                print(f"Error generating newsletter: {e}")
+
+    report_sla()
+    if trace_dir:
+        trace_path = tracer.export(trace_dir, collect_metrics())
+        print(f"Wrote trace to {trace_path}", file=sys.stderr)
+
+def ticker_command(args):
+    """Generates and prints the update for a single ticker."""
+    universe = load_universe(args.universe)
+    symbol = args.symbol.upper()
+    name = args.name or next((company.name for company in universe.companies if company.symbol == symbol), symbol)
+    tracer.start_run()
+    article_index.start_run()
+    budget.start(args.sla)
+    with tracer.span("run", universe=universe.key, companies=1):
+        with tracer.span("market_data"), budget.stage("market_data"):
+            market_data = fetch_market_data([symbol])
+        company_update = isolated(generate_company_update, name, symbol, market_data.get(symbol))
+    if args.trace_dir:
+        print(f"Wrote trace to {tracer.export(args.trace_dir, collect_metrics())}", file=sys.stderr)
+    if not company_update:
+        return 1
+    print(company_update, end="")
+
+def render_command(args):
+    """Re-renders a checkpointed run's newsletter from its saved sections, without calling any provider."""
+    universe = load_universe(args.universe)
+    checkpoint = Checkpoint(args.run_id)
+    if not checkpoint.sections:
+        print(f"No checkpointed sections for run {args.run_id} in {checkpoint.directory}", file=sys.stderr)
+        return 1
+    etf_intro = checkpoint.sections.get(overview_key(universe.overview), "") if universe.overview else ""
+    if args.subscribers:
+        paths = render_newsletters(load_subscribers(args.subscribers), universe, etf_intro, checkpoint.sections,
+                                   args.output_dir, args.editor)
+        print(f"Wrote {len(paths)} newsletters to {args.output_dir}")
+        return
+
+    company_updates = [
+        checkpoint.sections[company.symbol] for company in universe.companies if company.symbol in checkpoint.sections
+    ]
+    missing = len(universe.companies) - len(company_updates)
+    if missing:
+        print(f"{missing} of {len(universe.companies)} companies have no checkpointed section", file=sys.stderr)
+    print("".join(edit_sections(iter_newsletter(company_updates, etf_intro, universe), args.editor)))
+
+def serve_command(args):
+    """Keeps the newsletter fresh in this process and serves it over HTTP until interrupted."""
+    # The HTTP server is only imported by this command, so the other commands start faster
+    from service import NewsletterService, serve
+    universe = load_universe(args.universe)
+    serve(NewsletterService(universe, sla=args.sla), args.host, args.port)
+
+def run_command(args):
+    main(trace_dir=args.trace_dir, universe=args.universe, shards=max(1, args.shards), run_id=args.run_id,
+         subscribers=args.subscribers, output_dir=args.output_dir, sla=args.sla)
+
+COMMANDS = {
+    "run": run_command,
+    "ticker": ticker_command,
+    "render": render_command,
+    "serve": serve_command
+}
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Without a subcommand, `python main.py [options]` is a full run
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["run"] + argv
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--universe", default=UNIVERSE,
+                        help="ticker universe: a JSON/CSV file, or the name of a file under universes/")
+    instrumented = argparse.ArgumentParser(add_help=False)
+    instrumented.add_argument("--trace-dir", default=TRACE_DIR,
+                              help="write a JSON trace and a Prometheus metrics.prom file for the run into this directory")
+    instrumented.add_argument("--profile", nargs="?", const="profile.pstats", metavar="PATH",
+                              help="dump cProfile stats for the run, including worker threads (default: profile.pstats)")
+    deadlines = argparse.ArgumentParser(add_help=False)
+    deadlines.add_argument("--sla", type=float, default=SLA_SECONDS, metavar="SECONDS",
+                           help="publish within this many seconds, falling back to cached or partial "
+                                "content marked stale (default: %(default)s, no deadline)")
+    recipients = argparse.ArgumentParser(add_help=False)
+    recipients.add_argument("--subscribers",
+                            help="JSON list of subscribers with watchlists; writes one newsletter per subscriber")
+    recipients.add_argument("--output-dir", default=OUTPUT_DIR,
+                            help="directory for the per-subscriber newsletters (default: %(default)s)")
+
+    parser = argparse.ArgumentParser(description="Generate the Magnificent Seven newsletter.")
+    commands = parser.add_subparsers(dest="command", metavar="{run,ticker,render,serve}")
+    run = commands.add_parser("run", parents=[common, instrumented, deadlines, recipients],
+                              help="generate the newsletter (the default)")
+    run.add_argument("--shards", type=int, default=SHARDS,
+                     help="split the universe across this many worker processes")
+    run.add_argument("--run-id",
+                     help="checkpoint completed sections under this id; rerun with the same id to resume")
+    ticker = commands.add_parser("ticker", parents=[common, instrumented, deadlines], help="generate the update for one ticker")
+    ticker.add_argument("symbol")
+    ticker.add_argument("--name", help="company name (default: looked up in the universe, else the symbol)")
+    render = commands.add_parser("render", parents=[common, recipients],
+                                 help="re-render a checkpointed run without calling any provider")
+    render.add_argument("--run-id", required=True, help="the run whose checkpointed sections to render")
+    render.add_argument("--editor", default=NEWSLETTER_EDITOR, help="newsletter editor (default: %(default)s)")
+    serve = commands.add_parser("serve", parents=[common, deadlines],
+                                help="keep the newsletter fresh on a schedule and serve it over local HTTP")
+    serve.add_argument("--host", default=SERVICE_HOST, help="address to listen on (default: %(default)s)")
+    serve.add_argument("--port", type=int, default=SERVICE_PORT, help="port to listen on (default: %(default)s)")
+    return parser.parse_args(argv)
+
+def run_cli(argv=None):
+    args = parse_args(argv)
+    command = COMMANDS[args.command]
+    profile_path = getattr(args, "profile", None)
+    if not profile_path:
+        return command(args) or 0
 
-        print(refined_newsletter)
-    except Exception as e:
-        print(f"Error generating newsletter: {e}")
+    import pstats
+    with tracer.profile(profile_path):
+        status = command(args)
+    pstats.Stats(profile_path, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+    return status or 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(run_cli())
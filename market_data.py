@@ -0,0 +1,83 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import scheduler
+from clients import registry
+from deadline import budget, mark_stale
+from price_store import price_store
+from tracing import tracer
+from config import MARKET_DATA_CHUNK_SIZE
+
+def fetch_market_data(symbols, clients=registry, chunk_size=MARKET_DATA_CHUNK_SIZE, store=price_store, max_age=None):
+    """Brings every symbol's stored price history up to date and returns its price metrics.
+
+    Only symbols whose history is not fresh are downloaded, from their first missing day,
+    one request per `chunk_size` symbols that share that day. Returns a dict mapping each
+    symbol to its `PriceStore.metrics` row, which includes the {"closing_price",
+    "change_percent"} that `StockDataAgent.get_stock_data` produces. Symbols with no
+    history are left out; symbols whose refresh failed keep their stored history, flagged stale.
+    `max_age` refreshes histories older than that many seconds, if sooner than the store would.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    by_start = defaultdict(list)
+    for symbol in symbols:
+        start = store.fetch_start(symbol, max_age=max_age)
+        if start is not None:
+            by_start[start].append(symbol)
+    chunks = [
+        (group[index:index + chunk_size], start)
+        for start, group in by_start.items() for index in range(0, len(group), chunk_size)
+    ]
+
+    failed = set()
+    if len(chunks) == 1:
+        failed.update(fetch_price_history_chunk(*chunks[0], clients, store))
+    elif chunks:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), scheduler.providers["yahoo"].max_concurrency)) as executor:
+            futures = [
+                executor.submit(tracer.wrap(fetch_price_history_chunk), chunk, start, clients, store)
+                for chunk, start in chunks
+            ]
+            for future in futures:
+                failed.update(future.result())
+    with tracer.span("price_metrics", symbols=len(symbols)):
+        return store.metrics(symbols, stale=failed)
+
+def fetch_price_history_chunk(symbols, start, clients=registry, store=price_store):
+    """Downloads `symbols`' daily bars from `start` in a single request into the store.
+
+    Returns the symbols that could not be refreshed.
+    """
+    try:
+        bars = scheduler.call("yahoo", clients.yahoo_ohlcv, symbols, start.isoformat())
+    except Exception as e:
+        print(f"Error fetching price history for {', '.join(symbols)}: {e}")
+        return symbols
+    readjusted = [symbol for symbol in symbols if not store.write(symbol, bars.get(symbol, {}))]
+    if not readjusted:
+        return []
+    # A split or dividend re-adjusted these symbols' past prices; replace their whole history
+    tracer.count("price_history_reloads", len(readjusted))
+    try:
+        bars = scheduler.call("yahoo", clients.yahoo_ohlcv, readjusted, store.history_start().isoformat())
+    except Exception as e:
+        print(f"Error reloading price history for {', '.join(readjusted)}: {e}")
+        return readjusted
+    for symbol in readjusted:
+        store.write(symbol, bars.get(symbol, {}), replace=True)
+    return []
+
+def symbol_market_data(symbol, market_data=None, clients=registry):
+    """One symbol's market-data row: the batch row when one was handed in, else fetched on its own.
+
+    Notes a stale price, or under an SLA a missing one, on the section being built.
+    """
+    if market_data is None:
+        market_data = fetch_market_data([symbol], clients).get(symbol)
+    if market_data is None:
+        if budget.active:
+            mark_stale("price unavailable")
+    elif market_data.get("stale"):
+        mark_stale(f"price as of {market_data['as_of']}")
+    return market_data
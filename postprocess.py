@@ -0,0 +1,131 @@
+import re
+import sys
+from agents import SummaryEditorAgent
+from deadline import STALE_MARKER
+from similarity import shingles, jaccard
+
+SUMMARY_MARKER = "News Summary:"
+
+def split_paragraphs(content):
+    return [paragraph for paragraph in re.split(r"\n\s*\n", content) if paragraph.strip()]
+
+def ends_summary(paragraph):
+    """Whether `paragraph` starts something other than the summary before it: a section, the sign-off or a stale marker."""
+    stripped = paragraph.strip()
+    return stripped.startswith(("**", "Stay tuned", "- **", STALE_MARKER)) or SUMMARY_MARKER in paragraph
+
+class DedupEditor:
+    """Removes repeated or near-duplicate paragraphs that follow a "News Summary:" block.
+
+    Every paragraph from a "News Summary:" line up to the next bold section header is
+    compared with the paragraphs already kept for that summary. It is dropped when the
+    Jaccard similarity of their word shingles reaches `threshold`. Stale markers are always kept.
+    """
+    name = "dedup"
+    # Sections can be edited one at a time as they are produced
+    streaming = True
+
+    def __init__(self, threshold=0.6, shingle_size=3):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+    def edit(self, newsletter_content):
+        """Returns (cleaned_newsletter, removed_paragraphs)."""
+        kept, removed = [], []
+        summary_shingles = None
+        for paragraph in split_paragraphs(newsletter_content):
+            stripped = paragraph.strip()
+            if SUMMARY_MARKER in paragraph:
+                summary_text = paragraph.split(SUMMARY_MARKER, 1)[1]
+                summary_shingles = [shingles(summary_text, self.shingle_size)]
+            elif stripped.startswith("**") or stripped.startswith("Stay tuned") or stripped.startswith("- **"):
+                summary_shingles = None
+            elif stripped.startswith(STALE_MARKER):
+                pass
+            elif summary_shingles is not None:
+                candidate = shingles(paragraph, self.shingle_size)
+                if any(jaccard(candidate, previous) >= self.threshold for previous in summary_shingles):
+                    removed.append(paragraph)
+                    continue
+                summary_shingles.append(candidate)
+            kept.append(paragraph)
+        if not removed:
+            return newsletter_content, removed
+        trailing = newsletter_content[len(newsletter_content.rstrip()):]
+        return "\n\n".join(kept).rstrip() + trailing, removed
+
+class LLMEditor:
+    """Opt-in fallback that sends each multi-paragraph "News Summary:" block through `SummaryEditorAgent`.
+
+    Only the summary text is sent, without the dated header or the prices, so an unchanged
+    summary is edited from the cache on later runs. Single-paragraph summaries are left alone.
+    """
+    name = "llm"
+    streaming = False
+
+    def edit(self, newsletter_content):
+        editor = SummaryEditorAgent()
+        paragraphs = split_paragraphs(newsletter_content)
+        kept, removed = [], []
+        index = 0
+        while index < len(paragraphs):
+            paragraph = paragraphs[index]
+            index += 1
+            if SUMMARY_MARKER not in paragraph:
+                kept.append(paragraph)
+                continue
+            end = index
+            while end < len(paragraphs) and not ends_summary(paragraphs[end]):
+                end += 1
+            if end == index:
+                kept.append(paragraph)
+                continue
+            prefix, summary = paragraph.split(SUMMARY_MARKER, 1)
+            block = [SUMMARY_MARKER + summary] + paragraphs[index:end]
+            cleaned = editor.remove_extra_summary("\n\n".join(block)).strip()
+            if not cleaned.startswith(SUMMARY_MARKER):
+                # Not an edited summary; keep the block as it was
+                cleaned = "\n\n".join(block)
+            edited = split_paragraphs(cleaned)
+            edited[0] = prefix + edited[0]
+            remaining = {part.strip() for part in edited}
+            removed.extend(part for part in paragraphs[index:end] if part.strip() not in remaining)
+            kept.extend(edited)
+            index = end
+        if not removed:
+            return newsletter_content, removed
+        trailing = newsletter_content[len(newsletter_content.rstrip()):]
+        return "\n\n".join(kept).rstrip() + trailing, removed
+
+EDITORS = {
+    DedupEditor.name: DedupEditor,
+    LLMEditor.name: LLMEditor
+}
+
+def edit_sections(sections, editor_name="dedup", report=True):
+    """Yields the edited newsletter section by section and, with `report`, lists what was removed on stderr.
+
+    Streaming editors edit each section as soon as it arrives. Other editors wait for the
+    whole newsletter and yield it as a single section.
+    """
+    editor_class = EDITORS.get(editor_name)
+    if editor_class is None:
+        print(f"Unknown newsletter editor '{editor_name}', expected one of: {', '.join(EDITORS)}", file=sys.stderr)
+        yield from sections
+        return
+    editor = editor_class()
+    removed = []
+    if editor.streaming:
+        for section in sections:
+            cleaned, section_removed = editor.edit(section)
+            removed.extend(section_removed)
+            yield cleaned
+    else:
+        cleaned, removed = editor.edit("".join(sections))
+        yield cleaned
+
+    if not report:
+        return
+    print(f"[{editor.name} editor] removed {len(removed)} paragraph(s)", file=sys.stderr)
+    for paragraph in removed:
+        print(f"  - {paragraph.strip()[:120]}", file=sys.stderr)
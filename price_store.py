@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import warnings
+from datetime import date, timedelta
+from config import PRICE_STORE_DIR, PRICE_HISTORY_DAYS, PRICE_REFRESH_SECONDS
+
+# numpy is imported on first use, so importing the CLI stays cheap
+
+FIELDS = ("open", "high", "low", "close", "volume")
+
+TRADING_DAYS_PER_YEAR = 252
+
+# Trading days covered by each reported change, counted back from the latest close
+HORIZONS = {"change_percent": 1, "change_5d": 5, "change_1m": 21}
+
+VOLATILITY_DAYS = 20
+MOVING_AVERAGE_DAYS = (20, 50)
+
+# Trading days per symbol considered by `metrics`; enough for a year-to-date change
+METRICS_WINDOW = 300
+
+# Relative difference between a stored and a re-downloaded close that means Yahoo has
+# re-adjusted the history for a split or dividend
+ADJUSTMENT_TOLERANCE = 1e-4
+
+def bars_dtype():
+    import numpy as np
+    return np.dtype([("date", "datetime64[D]")] + [(field, "f8") for field in FIELDS])
+
+def bars_to_array(bars):
+    """Converts one symbol's {"date": [...], "open": [...], ...} bars into a date-sorted structured array."""
+    import numpy as np
+    rows = np.zeros(len(bars.get("date", [])), dtype=bars_dtype())
+    rows["date"] = np.array(bars.get("date", []), dtype="datetime64[D]")
+    for field in FIELDS:
+        rows[field] = np.array(bars.get(field, [np.nan] * len(rows)), dtype="f8")
+    return np.sort(rows, order="date")
+
+class PriceStore:
+    """Daily OHLCV history per ticker, kept on disk as one NumPy file per symbol.
+
+    Each file holds a date-sorted structured array (date, open, high, low, close, volume)
+    and is read memory-mapped. A refresh downloads only from the last two stored days onwards:
+    the last day's bar may have been taken mid-session, and the settled day before it must
+    match its stored close. Prices are split- and dividend-adjusted, so a mismatch means the
+    whole history was re-adjusted and is downloaded again. A symbol whose file was written
+    within `refresh_seconds` is not refreshed at all. New symbols start with `history_days`
+    calendar days of history.
+    """
+    def __init__(self, directory=PRICE_STORE_DIR, history_days=PRICE_HISTORY_DAYS,
+                 refresh_seconds=PRICE_REFRESH_SECONDS):
+        self.directory = directory
+        self.history_days = history_days
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+
+    def path(self, symbol):
+        return os.path.join(self.directory, f"{symbol.replace(os.sep, '_')}.npy")
+
+    def load(self, symbol):
+        """The symbol's stored bars, memory-mapped, or None if it has none."""
+        import numpy as np
+        try:
+            return np.load(self.path(symbol), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def fetch_start(self, symbol, today=None, max_age=None):
+        """The first day to download for `symbol`, or None when its history is fresh.
+
+        `max_age` tightens `refresh_seconds` for callers that need fresher prices.
+        """
+        refresh_seconds = self.refresh_seconds if max_age is None else min(max_age, self.refresh_seconds)
+        try:
+            if time.time() - os.path.getmtime(self.path(symbol)) < refresh_seconds:
+                return None
+        except OSError:
+            pass
+        history = self.load(symbol)
+        if history is None or len(history) == 0:
+            return self.history_start(today)
+        return history["date"][-min(2, len(history))].astype(date)
+
+    def history_start(self, today=None):
+        """The first day downloaded for a symbol with no usable history."""
+        return (today or date.today()) - timedelta(days=self.history_days)
+
+    def write(self, symbol, bars, replace=False):
+        """Merges downloaded bars into the symbol's file, replacing the stored days they cover.
+
+        Unless `replace`, returns False and writes nothing when a settled stored day closes
+        differently in `bars`, since the stored history then needs downloading again whole.
+        """
+        import numpy as np
+        rows = bars_to_array(bars)
+        path = self.path(symbol)
+        with self._lock:
+            history = self.load(symbol)
+            if len(rows) == 0:
+                # Nothing new; mark the history as checked so it is not requested again right away
+                if history is not None:
+                    os.utime(path)
+                    return True
+            elif history is not None and not replace:
+                settled = history[:-1]
+                _, stored, fetched = np.intersect1d(settled["date"], rows["date"], return_indices=True)
+                if not np.allclose(rows["close"][fetched], settled["close"][stored],
+                                   rtol=ADJUSTMENT_TOLERANCE, atol=0, equal_nan=True):
+                    return False
+                rows = np.concatenate([history[history["date"] < rows["date"][0]], rows])
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, rows)
+            os.replace(temporary, path)
+            return True
+
+    def metrics(self, symbols, stale=()):
+        """Computes every symbol's price metrics at once from its stored history.
+
+        The latest METRICS_WINDOW closes of all symbols are right-aligned into one matrix,
+        so each metric is a single vectorized expression across symbols. Returns symbol ->
+        {"closing_price", "change_percent" (1 day), "change_5d", "change_1m", "change_ytd",
+        "volatility" (20-day, annualized), "ma_20", "ma_50", "as_of", "stale"}, with changes
+        and volatility in percent and None where the history is too short. Symbols with no
+        history are left out; those in `stale` failed to refresh and are flagged.
+        """
+        import numpy as np
+        histories = {symbol: self.load(symbol) for symbol in dict.fromkeys(symbols)}
+        histories = {symbol: history for symbol, history in histories.items() if history is not None and len(history)}
+        if not histories:
+            return {}
+
+        names = list(histories)
+        window = min(METRICS_WINDOW, max(len(history) for history in histories.values()))
+        closes = np.full((len(names), window), np.nan)
+        dates = np.full((len(names), window), np.datetime64("NaT"), dtype="datetime64[D]")
+        for row, symbol in enumerate(names):
+            tail = histories[symbol][-window:]
+            closes[row, window - len(tail):] = tail["close"]
+            dates[row, window - len(tail):] = tail["date"]
+
+        metrics = {}
+        last = closes[:, -1]
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for name, days in HORIZONS.items():
+                base = closes[:, -1 - days] if days < window else np.full(len(names), np.nan)
+                metrics[name] = (last / base - 1) * 100
+
+            # Year to date: against the last close of the previous calendar year
+            year_start = dates[:, -1].astype("datetime64[Y]").astype("datetime64[D]")
+            before = dates < year_start[:, None]
+            base_index = window - 1 - np.argmax(before[:, ::-1], axis=1)
+            ytd_base = np.where(before.any(axis=1), closes[np.arange(len(names)), base_index], np.nan)
+            metrics["change_ytd"] = (last / ytd_base - 1) * 100
+
+            if window > VOLATILITY_DAYS:
+                returns = np.diff(np.log(closes[:, -VOLATILITY_DAYS - 1:]), axis=1)
+                volatility = returns.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+                metrics["volatility"] = np.where(np.isnan(returns).any(axis=1), np.nan, volatility)
+            else:
+                metrics["volatility"] = np.full(len(names), np.nan)
+
+            for days in MOVING_AVERAGE_DAYS:
+                recent = closes[:, -days:]
+                if recent.shape[1] < days:
+                    metrics[f"ma_{days}"] = np.full(len(names), np.nan)
+                else:
+                    metrics[f"ma_{days}"] = np.where(np.isnan(recent).any(axis=1), np.nan, recent.mean(axis=1))
+
+        def value(number):
+            return None if np.isnan(number) else round(float(number), 4)
+
+        rows = {}
+        for row, symbol in enumerate(names):
+            rows[symbol] = {"closing_price": float(last[row])}
+            rows[symbol].update({name: value(values[row]) for name, values in metrics.items()})
+            # Callers format the 1-day change as a number; a single stored day counts as unchanged
+            rows[symbol]["change_percent"] = rows[symbol]["change_percent"] or 0.0
+            rows[symbol]["as_of"] = str(dates[row, -1])
+            rows[symbol]["stale"] = symbol in stale
+        return rows
+
+price_store = PriceStore()
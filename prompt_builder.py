@@ -0,0 +1,129 @@
+import json
+import re
+from collections import namedtuple
+from similarity import shingles, jaccard
+
+# Bump whenever SUMMARY_INSTRUCTIONS changes so cached summaries are not reused
+PROMPT_VERSION = 2
+
+SUMMARY_INSTRUCTIONS = """You are a financial expert. Write a concise, informative and engaging summary (under 200 words) of the news articles below about {company_name} stock, in the style of Inshorts, ready to print in a financial newsletter.
+Cover the key findings, important metrics, likely impact on the stock price and overall market sentiment.
+Write one plain paragraph. Do not repeat it, rewrite it, or comment on it.
+
+Example:
+Tesla's stock has plummeted over 40% due to declining sales in China and poor German sales data. Despite this, analysts point to strong brand loyalty and innovative products. With market sentiment bearish, investors should be cautious but watch for buying opportunities.
+
+News Articles:
+{articles}
+
+Respond with ONLY the summary and no other text."""
+
+BATCH_INSTRUCTIONS = """You are a financial expert. For each company below, write a concise, informative and engaging summary (under 200 words) of its news articles, in the style of Inshorts, ready to print in a financial newsletter.
+Cover the key findings, important metrics, likely impact on the stock price and overall market sentiment. Each summary is one plain paragraph.
+
+Example summary:
+Tesla's stock has plummeted over 40% due to declining sales in China and poor German sales data. Despite this, analysts point to strong brand loyalty and innovative products. With market sentiment bearish, investors should be cautious but watch for buying opportunities.
+
+{sections}
+
+Respond with ONLY a JSON object that maps each company name exactly as written above to its summary string, for example {{"{first_company}": "..."}}."""
+
+BuiltPrompt = namedtuple("BuiltPrompt", ["text", "tokens", "articles", "dropped", "lines"])
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    """Approximates the model token count locally: one token per word or punctuation mark."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+def dedupe_articles(news_articles, threshold=0.6):
+    """Drops articles whose title is a near duplicate of an earlier article's title."""
+    kept, kept_titles = [], []
+    for article in news_articles:
+        title = shingles(article.get('title', ''), size=1)
+        if any(jaccard(title, previous) >= threshold for previous in kept_titles):
+            continue
+        kept.append(article)
+        kept_titles.append(title)
+    return kept
+
+def rank_articles(news_articles):
+    """Orders articles by value: articles new since earlier runs first, then those with snippets
+    ahead of bare titles, then SerpAPI's relevance position."""
+    return sorted(
+        enumerate(news_articles),
+        key=lambda item: (item[1].get('new') is False, not item[1].get('snippet'), item[1].get('position', item[0] + 1))
+    )
+
+def article_line(article, with_snippet=True):
+    line = f"- {article.get('title', '').strip()}"
+    if with_snippet and article.get('snippet'):
+        line += f": {article['snippet'].strip()}"
+    return line
+
+def build_summary_prompt(news_articles, company_name, token_budget):
+    """Builds the summary prompt, packing the highest-value articles into `token_budget` tokens.
+
+    The budget covers the whole prompt. An article whose snippet no longer fits is packed by
+    title alone. The articles that made it into the prompt keep their original order.
+    """
+    instructions = SUMMARY_INSTRUCTIONS.format(company_name=company_name, articles="")
+    used_tokens = count_tokens(instructions)
+    candidates = dedupe_articles(news_articles)
+
+    selected = {}
+    for index, article in rank_articles(candidates):
+        for with_snippet in (True, False):
+            line = article_line(article, with_snippet)
+            line_tokens = count_tokens(line)
+            if used_tokens + line_tokens <= token_budget:
+                selected[index] = line
+                used_tokens += line_tokens
+                break
+
+    articles = [candidates[index] for index in sorted(selected)]
+    lines = [selected[index] for index in sorted(selected)]
+    text = SUMMARY_INSTRUCTIONS.format(company_name=company_name, articles="\n".join(lines))
+    return BuiltPrompt(text, count_tokens(text), articles, len(news_articles) - len(articles), lines)
+
+def build_batch_prompt(company_prompts):
+    """Combines per-company prompts (company name -> BuiltPrompt) into one JSON-keyed request.
+
+    Each company keeps the article lines its single-company prompt packed, so a batched
+    summary covers the same content as the per-company call it replaces. An article already
+    listed under an earlier company is repeated by title only, so each snippet is sent once.
+    """
+    sent, sections = set(), []
+    for company_name, prompt in company_prompts.items():
+        lines = []
+        for article, line in zip(prompt.articles, prompt.lines):
+            key = article.get('key') or article.get('title', '').strip()
+            lines.append(article_line(article, with_snippet=False) if key in sent else line)
+            sent.add(key)
+        sections.append(f"Company: {company_name}\nNews Articles:\n" + "\n".join(lines))
+    sections = "\n\n".join(sections)
+    first_company = next(iter(company_prompts), "Company")
+    return BATCH_INSTRUCTIONS.format(sections=sections, first_company=first_company)
+
+def parse_batch_summaries(text, company_names):
+    """Extracts the valid per-company summaries from a batched JSON response.
+
+    Companies whose entry is missing, empty or not a string are left out so the caller can
+    summarize them individually.
+    """
+    if not text:
+        return {}
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        payload = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(payload, dict):
+        return {}
+    return {
+        company_name: payload[company_name].strip()
+        for company_name in company_names
+        if isinstance(payload.get(company_name), str) and payload[company_name].strip()
+    }
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from cache import DiskCache
+from clients import ClientRegistry
+from deadline import request_timeout
+from config import FIXTURES_DIR, REPLAY_LATENCY, REPLAY_ERROR_RATE, REPLAY_SEED
+
+class StandInError(Exception):
+    """Injected provider failure; carries a 503 so the scheduler treats it as transient."""
+    status_code = 503
+
+class StandInTimeout(TimeoutError):
+    """Injected read timeout, raised when a simulated call is slower than its request timeout."""
+
+class MissingFixtureError(Exception):
+    """Raised in replay mode when no response was recorded for a request."""
+
+def bars_since(ohlcv, start):
+    """Keeps the `yahoo_ohlcv` bars dated `start` (YYYY-MM-DD) or later, leaving out symbols with none."""
+    trimmed = {}
+    for symbol, bars in ohlcv.items():
+        first = next((index for index, day in enumerate(bars["date"]) if day >= start), len(bars["date"]))
+        if first < len(bars["date"]):
+            trimmed[symbol] = {field: values[first:] for field, values in bars.items()}
+    return trimmed
+
+def fixture_key(*parts):
+    return DiskCache.hash_key(*parts)
+
+def serpapi_key(search_params):
+    return DiskCache.make_key(search_params)
+
+class StandInRegistry(ClientRegistry):
+    """Base for registries that stand in for the live providers.
+
+    Every provider call is counted per method, and so is every call that fails, with the
+    requests that had no recorded response listed in `missing`. Replay and synthetic
+    registries also add REPLAY_LATENCY seconds (+/-50%) per call, timing out like a live
+    request when that runs past the request timeout, and fail REPLAY_ERROR_RATE of calls.
+    """
+    simulate = True
+
+    def __init__(self, latency=REPLAY_LATENCY, error_rate=REPLAY_ERROR_RATE, seed=REPLAY_SEED, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.failures = Counter()
+        self.missing = []
+        self._stand_in_lock = threading.Lock()
+
+    def _call(self, method):
+        with self._stand_in_lock:
+            self.calls[method] += 1
+            delay = self.latency * self.random.uniform(0.5, 1.5) if self.latency else 0.0
+            fail = self.error_rate and self.random.random() < self.error_rate
+        if not self.simulate:
+            return
+        if delay:
+            read_timeout = request_timeout(self.timeout)[1]
+            if delay > read_timeout:
+                time.sleep(read_timeout)
+                self._fail(method)
+                raise StandInTimeout(f"{method} timed out after {read_timeout:.1f}s")
+            time.sleep(delay)
+        if fail:
+            self._fail(method)
+            raise StandInError(f"Injected failure in {method}")
+
+    def _fail(self, method, missing=None):
+        with self._stand_in_lock:
+            self.failures[method] += 1
+            if missing:
+                self.missing.append(missing)
+
+class FixtureStore:
+    """One JSON file per recorded response, under <directory>/<provider>/<key>.json."""
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+
+    def path(self, provider, key):
+        return os.path.join(self.directory, provider, f"{key}.json")
+
+    def save(self, provider, key, value):
+        path = self.path(provider, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+
+    def load(self, provider, key):
+        try:
+            with open(self.path(provider, key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise MissingFixtureError(f"No recorded {provider} response for key {key} in {self.directory}")
+
+class RecordingRegistry(StandInRegistry):
+    """Calls the live providers and saves every response as a fixture."""
+    simulate = False
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.store = FixtureStore(fixtures_dir)
+
+    def _record(self, method, provider, key, fetch):
+        self._call(method)
+        try:
+            response = fetch()
+        except Exception:
+            self._fail(method)
+            raise
+        self.store.save(provider, key, response)
+        return response
+
+    def yahoo_ohlcv(self, symbols, start):
+        # Keyed without `start`, which moves with the calendar, so the fixture replays on any day
+        return self._record("yahoo_ohlcv", "yahoo", fixture_key("ohlcv", sorted(symbols)),
+                            lambda: super(RecordingRegistry, self).yahoo_ohlcv(symbols, start))
+
+    def serpapi_search(self, search_params):
+        return self._record("serpapi_search", "serpapi", serpapi_key(search_params),
+                            lambda: super(RecordingRegistry, self).serpapi_search(search_params))
+
+    def together_complete(self, payload):
+        return self._record("together_complete", "together", fixture_key(payload),
+                            lambda: super(RecordingRegistry, self).together_complete(payload))
+
+    def together_stream(self, payload):
+        return iter(self._record("together_stream", "together", fixture_key(payload, "stream"),
+                                 lambda: list(super(RecordingRegistry, self).together_stream(payload))))
+
+class ReplayRegistry(StandInRegistry):
+    """Serves recorded fixtures offline, with injected latency and errors."""
+    def __init__(self, fixtures_dir=FIXTURES_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.store = FixtureStore(fixtures_dir)
+
+    def _replay(self, method, provider, key):
+        self._call(method)
+        try:
+            return self.store.load(provider, key)
+        except MissingFixtureError as e:
+            self._fail(method, missing=str(e))
+            raise
+
+    def yahoo_ohlcv(self, symbols, start):
+        return bars_since(self._replay("yahoo_ohlcv", "yahoo", fixture_key("ohlcv", sorted(symbols))), start)
+
+    def serpapi_search(self, search_params):
+        return self._replay("serpapi_search", "serpapi", serpapi_key(search_params))
+
+    def together_complete(self, payload):
+        return self._replay("together_complete", "together", fixture_key(payload))
+
+    def together_stream(self, payload):
+        return iter(self._replay("together_stream", "together", fixture_key(payload, "stream")))
+
+# First day of synthetic price history
+SYNTHETIC_ORIGIN = date(2024, 1, 1)
+
+class SyntheticRegistry(StandInRegistry):
+    """Generates deterministic placeholder responses, for benchmarks without recorded fixtures."""
+    def _seed(self, *parts):
+        return int(hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:8], 16)
+
+    def _bars(self, symbol):
+        """Every business day's bar from SYNTHETIC_ORIGIN to today, the same on every call."""
+        rng = random.Random(self._seed(symbol))
+        price, bars = rng.uniform(50, 500), {"date": [], "open": [], "high": [], "low": [], "close": [], "volume": []}
+        day, today = SYNTHETIC_ORIGIN, date.today()
+        while day <= today:
+            if day.weekday() < 5:
+                open_price = price
+                price *= 1 + rng.gauss(0, 0.02)
+                bars["date"].append(day.isoformat())
+                bars["open"].append(round(open_price, 2))
+                bars["high"].append(round(max(open_price, price) * (1 + rng.uniform(0, 0.01)), 2))
+                bars["low"].append(round(min(open_price, price) * (1 - rng.uniform(0, 0.01)), 2))
+                bars["close"].append(round(price, 2))
+                bars["volume"].append(float(rng.randint(100_000, 10_000_000)))
+            day += timedelta(days=1)
+        return bars
+
+    def yahoo_ohlcv(self, symbols, start):
+        self._call("yahoo_ohlcv")
+        return bars_since({symbol: self._bars(symbol) for symbol in symbols}, start)
+
+    def serpapi_search(self, search_params):
+        self._call("serpapi_search")
+        query = search_params.get("q", "")
+        rng = random.Random(self._seed(query))
+        return {"news_results": [
+            {
+                "position": position,
+                "title": f"{query.replace(' stock news', '')} shares move as analysts weigh outlook, report {rng.randint(1, 999)}",
+                "snippet": f"Investors in {query.replace(' stock news', '')} reacted to quarterly guidance and "
+                           f"sector rotation, with volume {rng.randint(10, 90)}% above average.",
+                "link": f"https://news.example.com/{self._seed(query, position)}"
+            }
+            for position in range(1, 9)
+        ] + [
+            # Market-wide stories every search returns, under a per-query tracking link
+            {
+                "position": position,
+                "title": f"Megacap tech leads the market as traders weigh rate path, report {position}",
+                "snippet": "Large technology stocks drove the index as investors weighed the rate outlook "
+                           "and earnings season.",
+                "link": f"https://www.news.example.com/markets/{position}?utm_source={self._seed(query)}"
+            }
+            for position in range(9, 11)
+        ]}
+
+    def _summary(self, name):
+        return (f"{name} traded on mixed signals as analysts weighed guidance against sector rotation. "
+                f"Sentiment is cautious, and investors are watching upcoming catalysts for direction.")
+
+    def _text(self, prompt):
+        companies = re.findall(r"^Company: (.+)$", prompt, flags=re.MULTILINE)
+        if companies:
+            return json.dumps({company: self._summary(company) for company in companies})
+        match = re.search(r"about (.+?) stock", prompt)
+        return self._summary(match.group(1) if match else "The company")
+
+    def together_complete(self, payload):
+        self._call("together_complete")
+        return {"choices": [{"text": self._text(payload["prompt"])}]}
+
+    def together_stream(self, payload):
+        self._call("together_stream")
+        return iter(re.findall(r"\S+\s*", self._text(payload["prompt"])))
+
+STAND_INS = {
+    "record": RecordingRegistry,
+    "replay": ReplayRegistry,
+    "synthetic": SyntheticRegistry
+}
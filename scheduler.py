@@ -0,0 +1,278 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from email.utils import parsedate_to_datetime
+from deadline import DeadlineExceeded, attempt_deadline, call_timeout, remaining
+from tracing import tracer
+from config import PROVIDER_LIMITS, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """Raised for an error reported in a provider's response body rather than as an HTTP error."""
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def status_code_of(error):
+    """Finds the HTTP status code carried by an exception from requests, Together or yfinance, if any."""
+    response = getattr(error, "response", None)
+    for candidate in (getattr(error, "status_code", None), getattr(error, "http_status", None),
+                      getattr(response, "status_code", None)):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+def retry_after_of(error):
+    """Returns the Retry-After delay in seconds carried by an exception, if any."""
+    if getattr(error, "retry_after", None) is not None:
+        return float(error.retry_after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    status_code = status_code_of(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return (isinstance(error, (ConnectionError, TimeoutError))
+            or "RateLimit" in name or "Timeout" in name or "Connection" in name)
+
+class TokenBucket:
+    """Refills at `requests_per_minute` and holds at most `capacity` tokens."""
+    def __init__(self, requests_per_minute, capacity):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds`, e.g. after the provider sent Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Provider:
+    """Rate limit, concurrency cap, timeout, hedging delay and queue statistics for one upstream API."""
+    def __init__(self, name, requests_per_minute, max_concurrency, timeout=0.0, hedge_after=0.0):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_concurrency = max_concurrency
+        self.set_rate(requests_per_minute)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def set_rate(self, requests_per_minute):
+        # Allow bursts of up to ten seconds' worth of requests
+        self.bucket = TokenBucket(requests_per_minute, max(1.0, requests_per_minute / 6))
+
+    def enqueue(self):
+        with self.lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def dequeue(self, waited):
+        with self.lock:
+            self.queue_depth -= 1
+            self.requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "max_wait_seconds": round(self.max_wait, 3),
+                "avg_wait_seconds": round(self.total_wait / self.requests, 3) if self.requests else 0.0
+            }
+
+class Scheduler:
+    """Central gate for every outbound call to SerpAPI, Yahoo Finance and Together.
+
+    Each call waits for a free concurrency slot and a rate-limit token for its provider.
+    Retryable failures are retried with jittered exponential backoff. A Retry-After hint
+    replaces the backoff delay and pauses the whole provider for that long. Every attempt
+    is cut short at the provider's timeout or the current stage's deadline, whichever comes
+    first, with its HTTP timeouts capped to match. It is not retried once that deadline has
+    passed, nor before a timed-out request has stopped and given its slot back. Providers with `hedge_after`
+    send a duplicate of an attempt that is slow to answer and take whichever returns first.
+    """
+    def __init__(self, provider_limits=PROVIDER_LIMITS, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.providers = {
+            name: Provider(name, limits["requests_per_minute"], limits["max_concurrency"],
+                           limits.get("timeout", 0.0), limits.get("hedge_after", 0.0))
+            for name, limits in provider_limits.items()
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def call(self, provider_name, fn, *args, **kwargs):
+        """Runs `fn(*args, **kwargs)` within `provider_name`'s limits, retrying transient failures."""
+        provider = self.providers[provider_name]
+        attempt = 0
+        with tracer.span(provider_name) as span:
+            while True:
+                try:
+                    return self.attempt(provider, span, fn, args, kwargs)
+                except Exception as e:
+                    if isinstance(e, DeadlineExceeded):
+                        provider.count("timeouts")
+                        tracer.count("provider_timeouts", provider=provider_name)
+                    retry_after = retry_after_of(e)
+                    delay = retry_after if retry_after is not None else self.backoff(attempt)
+                    left = remaining()
+                    if (attempt >= self.max_retries or not is_retryable(e)
+                            or (left is not None and left <= delay) or not self.released(provider, e)):
+                        provider.count("failures")
+                        raise
+                    if retry_after is not None:
+                        provider.bucket.pause(retry_after)
+                    provider.count("retries")
+                    span.attributes["retries"] = attempt + 1
+                    tracer.count("provider_retries", provider=provider_name)
+                time.sleep(delay)
+                attempt += 1
+
+    def released(self, provider, error):
+        """Waits for a timed-out attempt's requests to give their slots back; False if they do not in time."""
+        running = getattr(error, "running", None)
+        if not running:
+            return True
+        timeout = call_timeout(provider.timeout)
+        return not wait(running, timeout=max(0.0, timeout or 0.0)).not_done
+
+    def attempt(self, provider, span, fn, args, kwargs, abandoned=None):
+        """Makes one attempt at the call, bounded by the provider's timeout and the stage deadline."""
+        timeout = call_timeout(provider.timeout)
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded(f"no time left for a {provider.name} call")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if timeout is None and not provider.hedge_after:
+            return self.run(provider, span, fn, args, kwargs)
+
+        # Attempts run on daemon threads so the caller can walk away from a hung one
+        abandoned = threading.Event()
+
+        def launch():
+            future = Future()
+
+            def run():
+                try:
+                    future.set_result(self.run(provider, span, fn, args, kwargs, abandoned, deadline))
+                except BaseException as e:
+                    future.set_exception(e)
+            threading.Thread(target=tracer.wrap(run), daemon=True).start()
+            return future
+
+        started = time.monotonic()
+        primary = launch()
+        pending = {primary}
+        if provider.hedge_after and (timeout is None or provider.hedge_after < timeout):
+            if not wait(pending, timeout=provider.hedge_after).done:
+                provider.count("hedges")
+                tracer.count("provider_hedges", provider=provider.name)
+                pending.add(launch())
+
+        error = None
+        try:
+            while pending:
+                left = None if timeout is None else timeout - (time.monotonic() - started)
+                if left is not None and left <= 0:
+                    break
+                done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            provider.count("hedge_wins")
+                        return future.result()
+                    error = error or future.exception()
+        finally:
+            abandoned.set()
+        if error is not None and not pending:
+            raise error
+        timed_out = DeadlineExceeded(f"{provider.name} call timed out after {timeout:.1f}s")
+        # Requests still in flight hold their slots until their own timeouts stop them
+        timed_out.running = pending
+        raise timed_out
+
+    def run(self, provider, span, fn, args, kwargs, abandoned=None, deadline=None):
+        """Waits for a slot and a token, then calls `fn` with its requests cut off at `deadline`."""
+        provider.enqueue()
+        queued_at = time.monotonic()
+        with provider.slots:
+            provider.bucket.acquire()
+            waited = time.monotonic() - queued_at
+            provider.dequeue(waited)
+            span.attributes["wait_seconds"] = span.attributes.get("wait_seconds", 0.0) + waited
+            if abandoned is not None and abandoned.is_set():
+                raise DeadlineExceeded(f"{provider.name} call abandoned while queued")
+            with attempt_deadline(deadline):
+                return fn(*args, **kwargs)
+
+    def share(self, process_count):
+        """Limits this process to 1/`process_count` of every provider's rate, for sharded runs."""
+        for provider in self.providers.values():
+            provider.set_rate(provider.requests_per_minute / process_count)
+
+    def stats(self):
+        return {name: provider.stats() for name, provider in self.providers.items()}
+
+scheduler = Scheduler()
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from agents import SummaryAgent, canonical_articles
+from article_index import article_index
+from engine import summarized_sections
+from market_data import fetch_market_data
+from tasks import fetch_news_task, iter_newsletter
+from deadline import budget
+from postprocess import edit_sections
+from tracing import tracer
+from universe import MAGNIFICENT_SEVEN
+from config import (
+    MAX_WORKERS, NEWSLETTER_EDITOR, BATCH_SUMMARIES, SLA_SECONDS, SERVICE_HOST, SERVICE_PORT, SERVICE_REFRESH_SECONDS,
+    SERVICE_CLOSE_REFRESH_SECONDS, SERVICE_CLOSE_WINDOW, SERVICE_IDLE_REFRESH_SECONDS, MARKET_TIMEZONE
+)
+
+# Regular session in the market's local time, as minutes after midnight
+MARKET_OPEN = 9 * 60 + 30
+MARKET_CLOSE = 16 * 60
+
+# What the service serves: the rendered newsletter and each section by symbol (the overview
+# under its ETF's), their ETags, when the content last changed and when it was last checked
+Snapshot = namedtuple("Snapshot", ["newsletter", "sections", "etags", "updated_at", "checked_at"])
+
+def market_time(now=None, zone=MARKET_TIMEZONE):
+    """`now` (default: the current time) in the market's timezone."""
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(zone)
+    except Exception:
+        # No timezone database; New York standard time is close enough for scheduling
+        tz = timezone(timedelta(hours=-5))
+    return (now or datetime.now(timezone.utc)).astimezone(tz)
+
+def refresh_interval(now=None, regular=SERVICE_REFRESH_SECONDS, near_close=SERVICE_CLOSE_REFRESH_SECONDS,
+                     close_window=SERVICE_CLOSE_WINDOW, idle=SERVICE_IDLE_REFRESH_SECONDS):
+    """Seconds until the next refresh: often around the close, rarely while the market is shut."""
+    local = market_time(now)
+    minutes = local.hour * 60 + local.minute
+    if local.weekday() < 5 and abs(minutes - MARKET_CLOSE) <= close_window:
+        return near_close
+    if local.weekday() < 5 and MARKET_OPEN <= minutes < MARKET_CLOSE:
+        return regular
+    return idle
+
+def etag(text):
+    return f'"{hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]}"'
+
+def news_digest(news_articles):
+    """Identifies a section's summary input: the titles and snippets its prompt would be built from."""
+    return hashlib.sha256(json.dumps(canonical_articles(news_articles)).encode("utf-8")).hexdigest()
+
+class NewsletterService:
+    """Keeps the newsletter for one universe up to date in a long-running process.
+
+    A background thread rebuilds it on the `refresh_interval` schedule, reusing one thread
+    pool, the shared provider sessions, caches and (for the local engine) the loaded model
+    across refreshes. Prices are refreshed at least once per interval. A section is only
+    re-summarized when its news changed; otherwise its previous summary is re-rendered with
+    the new prices. The newsletter itself is only rebuilt when a section changed. Readers
+    only ever get the latest snapshot, so however many there are, the pipeline runs at most
+    once per interval.
+    """
+    def __init__(self, universe=MAGNIFICENT_SEVEN, max_workers=MAX_WORKERS, editor=NEWSLETTER_EDITOR,
+                 batch_summaries=BATCH_SUMMARIES, sla=SLA_SECONDS):
+        self.universe = universe
+        self.editor = editor
+        self.batch_summaries = batch_summaries
+        self.sla = sla
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.snapshot = None
+        # Section name -> (news digest, summary) of the last summary that was not a fallback
+        self.summaries = {}
+        self.refreshes = 0
+        self.last_duration = None
+        self.next_refresh_at = None
+        self._stop = threading.Event()
+
+    def refresh(self, max_age=None):
+        """Rebuilds the sections whose prices or news changed; returns whether the newsletter changed."""
+        universe = self.universe
+        started = time.time()
+        tracer.start_run()
+        article_index.start_run()
+        budget.start(self.sla)
+        with tracer.span("refresh", universe=universe.key, companies=len(universe.companies)):
+            with tracer.span("market_data"), budget.stage("market_data"):
+                symbols = [company.symbol for company in universe.companies]
+                if universe.overview:
+                    symbols.append(universe.overview.symbol)
+                market_data = fetch_market_data(symbols, max_age=max_age)
+            # Searched again once per interval like the prices, never served stale; the sections
+            # then read these results from the news cache
+            fetch_news_task(universe, self.executor, max_age=max_age)
+
+            etf_intro, sections = summarized_sections(
+                self.executor, market_data, universe.companies, universe.overview, self.summarize
+            )
+            if universe.overview:
+                sections[universe.overview.symbol] = etf_intro
+
+            now = datetime.now()
+            changed = self.snapshot is None or sections != self.snapshot.sections
+            if changed:
+                with tracer.span("render", editor=self.editor), budget.stage("edit"):
+                    etf_intro = sections.get(universe.overview.symbol, "") if universe.overview else ""
+                    company_updates = [sections[company.symbol] for company in universe.companies
+                                       if company.symbol in sections]
+                    newsletter = "".join(edit_sections(
+                        iter_newsletter(company_updates, etf_intro, universe, as_of=now.strftime("%Y-%m-%d %H:%M:%S")),
+                        self.editor, report=False
+                    ))
+                etags = {symbol: etag(section) for symbol, section in sections.items()}
+                etags[None] = etag(newsletter)
+                self.snapshot = Snapshot(newsletter, sections, etags, now, now)
+            else:
+                self.snapshot = self.snapshot._replace(checked_at=now)
+        self.refreshes += 1
+        self.last_duration = time.time() - started
+        return changed
+
+    def summarize(self, company_articles):
+        """Summarizes the sections whose news changed since their last summary.
+
+        Returns (section name -> summary, names whose summary fell back to the extractive one).
+        Fallback summaries are not kept, so those sections are tried again on the next refresh.
+        """
+        digests = {name: news_digest(articles) for name, articles in company_articles.items()}
+        summaries = {
+            name: self.summaries[name][1] for name in company_articles
+            if self.summaries.get(name, (None,))[0] == digests[name]
+        }
+        changed = {name: articles for name, articles in company_articles.items() if name not in summaries}
+        tracer.count("sections_reused", len(summaries))
+        tracer.count("sections_resummarized", len(changed))
+        if not changed:
+            return summaries, set()
+
+        if self.batch_summaries:
+            summary_agent = SummaryAgent()
+            fresh = summary_agent.summarize_batch(changed)
+            fallbacks = set(summary_agent.fallbacks)
+        else:
+            def summarize(name):
+                summary_agent = SummaryAgent()
+                return summary_agent.summarize(changed[name], name), bool(summary_agent.fallbacks)
+            futures = {name: self.executor.submit(tracer.wrap(summarize), name) for name in changed}
+            fresh, fallbacks = {}, set()
+            for name, future in futures.items():
+                fresh[name], fell_back = future.result()
+                if fell_back:
+                    fallbacks.add(name)
+
+        for name, summary in fresh.items():
+            if name not in fallbacks:
+                self.summaries[name] = (digests[name], summary)
+        summaries.update(fresh)
+        return summaries, fallbacks
+
+    def run(self):
+        """Refreshes on schedule until `stop` is called."""
+        interval = None
+        while not self._stop.is_set():
+            try:
+                changed = self.refresh(max_age=interval)
+            except Exception as e:
+                tracer.error(e, stage="refresh")
+                print(f"Error refreshing the newsletter: {e}", file=sys.stderr)
+                changed = False
+            interval = refresh_interval()
+            self.next_refresh_at = datetime.now() + timedelta(seconds=interval)
+            print(f"Refresh {self.refreshes} took {self.last_duration or 0:.1f}s"
+                  f"{'' if changed else ', nothing changed'}; next in {interval}s", file=sys.stderr)
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        snapshot = self.snapshot
+        return {
+            "universe": self.universe.key,
+            "ready": snapshot is not None,
+            "refreshes": self.refreshes,
+            "last_refresh_seconds": self.last_duration,
+            "updated_at": snapshot.updated_at.isoformat() if snapshot else None,
+            "checked_at": snapshot.checked_at.isoformat() if snapshot else None,
+            "next_refresh_at": self.next_refresh_at.isoformat() if self.next_refresh_at else None,
+            "sections": sorted(snapshot.sections) if snapshot else []
+        }
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Serves the service's latest snapshot.
+
+    GET / (or /newsletter) returns the newsletter, /sections/<SYMBOL> one section and
+    /status the refresh state as JSON. Content responses carry an ETag and answer a
+    matching If-None-Match with 304 Not Modified.
+    """
+    def do_GET(self):
+        service = self.server.service
+        path = urlsplit(self.path).path.rstrip("/") or "/"
+        if path == "/status":
+            return self.respond(200, json.dumps(service.status(), indent=2), "application/json")
+
+        snapshot = service.snapshot
+        if snapshot is None:
+            return self.respond(503, "The first refresh has not finished yet.\n", headers={"Retry-After": "5"})
+        if path in ("/", "/newsletter"):
+            key, body = None, snapshot.newsletter
+        elif path.startswith("/sections/") and path[len("/sections/"):].upper() in snapshot.sections:
+            key = path[len("/sections/"):].upper()
+            body = snapshot.sections[key]
+        else:
+            return self.respond(404, "Not found. Try /newsletter, /sections/<SYMBOL> or /status.\n")
+
+        headers = {"ETag": snapshot.etags[key], "Last-Modified": self.date_time_string(snapshot.updated_at.timestamp())}
+        if snapshot.etags[key] in self.if_none_match():
+            return self.respond(304, None, headers=headers)
+        return self.respond(200, body, "text/markdown", headers)
+
+    def if_none_match(self):
+        header = self.headers.get("If-None-Match", "")
+        return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+    def respond(self, status, body, content_type="text/plain", headers=None):
+        payload = body.encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+def serve(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    """Runs `service`'s refresh loop in the background and serves its snapshots until interrupted."""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    refresher = threading.Thread(target=service.run, name="refresh", daemon=True)
+    refresher.start()
+    print(f"Serving the {service.universe.name} newsletter on http://{host}:{server.server_port}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        service.executor.shutdown(wait=False, cancel_futures=True)
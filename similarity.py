@@ -0,0 +1,17 @@
+import re
+
+def words(text):
+    """Lowercased words, keeping figures like $1.5 or 40% intact but dropping trailing punctuation."""
+    return [word for word in (token.strip(".'") for token in re.findall(r"[a-z0-9$%.']+", text.lower())) if word]
+
+def shingles(text, size=3):
+    """Returns the set of word `size`-grams in `text`, ignoring case and punctuation."""
+    tokens = words(text)
+    if len(tokens) < size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
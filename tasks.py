@@ -1,107 +1,146 @@
-from tools import generate_company_update
-from agents import NewsAgent, SummaryAgent
-import yfinance as yf  
+from tools import ARTICLES_PER_COMPANY, EXTRACTIVE_NOTE, generate_company_update, price_lines
+from agents import NewsAgent, SummaryAgent, search_news
+from article_index import article_index
+from deadline import budget, stale_line, stale_notes
+from market_data import symbol_market_data
+from tracing import tracer
+from universe import MAGNIFICENT_SEVEN
 from datetime import datetime
-from serpapi import GoogleSearch
+from functools import partial
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
 
 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S") 
-# List of Magnificent Seven Stocks
-MAGNIFICENT_SEVEN = ["Apple", "Microsoft", "Amazon", "Alphabet", "Meta", "Nvidia", "Tesla"]
-COMPANY_TICKER_MAP = {
-    "Apple": "AAPL",
-    "Microsoft": "MSFT",
-    "Amazon": "AMZN",
-    "Alphabet": "GOOGL",
-    "Meta": "META",
-    "Nvidia": "NVDA",
-    "Tesla": "TSLA"
-}
-
-def get_etf_data(etf_symbol):
-    """Fetches ETF data using yfinance."""
+
+def get_etf_data(etf_symbol, market_data=None):
+    """Fetches ETF data from the price store, unless a batch market-data row is handed in."""
     try:
-        etf = yf.Ticker(etf_symbol)
-        hist = etf.history(period="1d")  # Fetch todays data
-        if len(hist) == 0:
-            return None
-        closing_price = hist['Close'].iloc[-1]
-        previous_closing_price = hist['Close'].iloc[-1]
-        change_percent = ((closing_price - previous_closing_price) / previous_closing_price) * 100
-        return {
-            "closing_price": closing_price,
-            "change_percent": change_percent
-        }
+        return symbol_market_data(etf_symbol, market_data)
     except Exception as e:
+        tracer.error(e)
         print(f"Error fetching ETF data for {etf_symbol}: {e}")
         return None
 
-def fetch_magnificent_seven_news():
-    """Fetches news specifically about the Magnificent Seven as a whole."""
+def fetch_magnificent_seven_news(overview=MAGNIFICENT_SEVEN.overview, max_age=None):
+    """Fetches news specifically about the Magnificent Seven (or another universe's overview) as a whole."""
     api_key = os.getenv("SERPAPI_KEY")
     try:
         search_params = {
-            "q": "Magnificent Seven stock news",
+            "q": overview.query,
             "api_key": api_key,
             "engine": "google_news",
              "tbm": "nws" 
         }
-        search = GoogleSearch(search_params)
-        results = search.get_dict()
-        articles = results.get("news_results", [])
-        return articles
+        return article_index.add(overview.symbol, search_news(search_params, max_age=max_age))
     except Exception as e:
-        print(f"Error fetching news for Magnificent Seven: {e}")
+        tracer.error(e)
+        print(f"Error fetching news for {overview.name}: {e}")
         return []
 
-def generate_newsletter(company_updates):
-    """Generates a professional financial newsletter."""
-    # Fetch ETF Data
-    etf_data = get_etf_data("MAGS")  
-    magnificent_seven_news = fetch_magnificent_seven_news()
+def gather_etf_data(market_data=None, overview=MAGNIFICENT_SEVEN.overview):
+    """Fetches the MAGS ETF data and the Magnificent Seven news for the overview section.
+
+    Returns (etf_data, news, stale), where `stale` lists why the section is stale or partial.
+    """
+    with stale_notes() as stale:
+        with tracer.span("fetch", cached=market_data is not None), budget.stage("market_data"):
+            etf_data = get_etf_data(overview.symbol, market_data)
+        with tracer.span("search"), budget.stage("news"):
+            magnificent_seven_news = fetch_magnificent_seven_news(overview)
+    return etf_data, magnificent_seven_news, stale
+
+def format_etf_overview(etf_data, magnificent_seven_summary, overview=MAGNIFICENT_SEVEN.overview, stale=None):
+    """Renders the Magnificent Seven (MAGS) overview section from its data and news summary."""
+    etf_intro = ""
+    if etf_data or stale:
+        etf_intro = f"**{overview.title}**\n" + price_lines(etf_data) + (
+            f"News Summary: {magnificent_seven_summary}\n"
+            f"{stale_line(stale)}\n"
+        )
+    return etf_intro
+
+def generate_etf_overview(market_data=None, overview=MAGNIFICENT_SEVEN.overview, prompt_articles=None):
+    """Builds the Magnificent Seven (MAGS) overview section, from its `condensed_news` row if one is given."""
+    etf_data, magnificent_seven_news, stale = gather_etf_data(market_data, overview)
 
     # Create summary agent
-    summary_agent = SummaryAgent()
-    magnificent_seven_summary = summary_agent.summarize(magnificent_seven_news, "Magnificent Seven") #Added compnay name
+    with tracer.span("summarize"), budget.stage("summarize"):
+        summary_agent = SummaryAgent()
+        if prompt_articles is None:
+            magnificent_seven_news = article_index.novel(overview.symbol, magnificent_seven_news)
+        magnificent_seven_summary = summary_agent.summarize(
+            magnificent_seven_news, overview.name, prompt_articles=prompt_articles
+        )
+    if summary_agent.fallbacks:
+        stale.append(EXTRACTIVE_NOTE)
+
+    return format_etf_overview(etf_data, magnificent_seven_summary, overview, stale)
+
+def iter_newsletter(company_updates, etf_intro=None, universe=MAGNIFICENT_SEVEN, recipient="Investors", as_of=None):
+    """Yields the newsletter section by section, building the overview (unless `etf_intro` is given) after the header."""
+    overview = universe.overview
 
     # Create a structured, engaging format for the newsletter
-    newsletter_content = f"**Today's ({current_time}) Stock Market Update: The Magnificent Seven (MAGS)**\n\n"
+    title = f"The {universe.name} ({overview.symbol})" if overview else f"The {universe.name}"
+    header = f"**Today's ({as_of or current_time}) Stock Market Update: {title}**\n\n"
+    header += f"Hello {recipient},\n\n"
+    header += f"Here's the latest market movement of the {universe.name} stocks:\n\n"
+    if overview:
+        header += f"**{overview.name} (Overall):**\n\n"
+    yield header
 
     # Add ETF data to the beginning of the newsletter
-
-    newsletter_content += "Hello Investors,\n\n"
-    newsletter_content += "Here's the latest market movement of the Magnificent Seven stocks:\n\n"
-    newsletter_content += f"**Magnificent Seven (Overall):**\n\n"
-    etf_intro = ""
-    if etf_data:
-        change_percent = etf_data['change_percent']
-        etf_intro = (
-            f"**Roundhill Magnificent Seven ETF (BATS: MAGS)**\n"
-            f"Today's Closing Price: ${etf_data['closing_price']:.2f}\n"
-            f"Change Percent: {change_percent:.2f}%\n"
-            f"News Summary: {magnificent_seven_summary}\n\n"
-        )
-    newsletter_content += etf_intro
+    if etf_intro is None:
+        etf_intro = generate_etf_overview(overview=overview) if overview else ""
+    elif callable(etf_intro):
+        etf_intro = etf_intro()
+    yield etf_intro
 
     for update in company_updates:
-        newsletter_content += update
+        yield update
 
     # Closing remarks
-    newsletter_content += "Stay tuned for more updates.\n\n"
-    newsletter_content += "- **The Magnificent Seven Insider**\n"
-
-    return newsletter_content
-
-def fetch_news_task():
-    """Fetches the latest news on the Magnificent Seven stocks."""
-    news_items = []
-    for company_name, stock_symbol in COMPANY_TICKER_MAP.items():
-        # Create NewsAgent instance for each company and fetch the latest news articles
-        news_agent = NewsAgent(company_name, stock_symbol)
-        news = news_agent.fetch_news_articles()
-        news_items.extend(news)
-    return news_items
\ No newline at end of file
+    yield f"Stay tuned for more updates.\n\n- **The {universe.name} Insider**\n"
+
+def generate_newsletter(company_updates, etf_intro=None, universe=MAGNIFICENT_SEVEN, recipient="Investors"):
+    """Generates a professional financial newsletter.
+
+    The MAGS overview is built here unless a precomputed `etf_intro` is passed in.
+    """
+    return "".join(iter_newsletter(company_updates, etf_intro, universe, recipient))
+
+def fetch_news_task(universe=MAGNIFICENT_SEVEN, executor=None, max_age=None):
+    """Searches every company and the overview up front, so `ArticleIndex.novel` sees all shared articles."""
+    searches = [
+        partial(NewsAgent(company_name, stock_symbol).fetch_news_articles, max_age)
+        for company_name, stock_symbol in universe.companies
+    ]
+    symbols = [company.symbol for company in universe.companies]
+    if universe.overview:
+        searches.append(partial(fetch_magnificent_seven_news, universe.overview, max_age))
+        symbols.append(universe.overview.symbol)
+    with tracer.span("search", searches=len(searches)), budget.stage("news"):
+        if executor is None:
+            for search in searches:
+                search()
+        else:
+            for future in [executor.submit(tracer.wrap(search)) for search in searches]:
+                future.result()
+    return [dict(article, tickers=article_index.tickers(article)) for article in article_index.articles(symbols)]
+
+def condensed_news(universe=MAGNIFICENT_SEVEN):
+    """Condenses every section's novel articles at once, so sentence weights reflect the whole universe's news.
+
+    Reads the searches `fetch_news_task` already ran back from the news cache. Returns symbol
+    -> the articles for that section's prompt, for `generate_company_update` and `generate_etf_overview`.
+    """
+    sections = [
+        (symbol, name, NewsAgent(name, symbol).fetch_news_articles()[:ARTICLES_PER_COMPANY])
+        for name, symbol in universe.companies
+    ]
+    if universe.overview:
+        sections.append((universe.overview.symbol, universe.overview.name, fetch_magnificent_seven_news(universe.overview)))
+    with tracer.span("condense", sections=len(sections)):
+        condensed = SummaryAgent().condense(
+            {name: article_index.novel(symbol, news) for symbol, name, news in sections if news}
+        )
+    return {symbol: condensed[name] for symbol, name, _ in sections if name in condensed}
@@ -1,43 +1,86 @@
-import os
-from dotenv import load_dotenv
 from agents import StockDataAgent, NewsAgent, SummaryAgent
+from article_index import article_index
+from deadline import budget, stale_line, stale_notes
+from tracing import tracer
 
-# Load environment variables from .env file
-load_dotenv()
-
-# List of Magnificent Seven Stocks
-MAGNIFICENT_SEVEN = ["Apple", "Microsoft", "Amazon", "Alphabet", "Meta", "Nvidia", "Tesla"]
-COMPANY_TICKER_MAP = {
-    "Apple": "AAPL",
-    "Microsoft": "MSFT",
-    "Amazon": "AMZN",
-    "Alphabet": "GOOGL",
-    "Meta": "META",
-    "Nvidia": "NVDA",
-    "Tesla": "TSLA"
-}
-
-def generate_company_update(company_name, stock_symbol):
-    """Generates a company update string with stock data and news summary."""
-    stock_data_agent = StockDataAgent(stock_symbol)
-    stock_data = stock_data_agent.get_stock_data()
-
-    news_agent = NewsAgent(company_name, stock_symbol)
-    news_articles = news_agent.fetch_news_articles()[:5]
-
-    summary_agent = SummaryAgent()
-    news_summary = summary_agent.summarize(news_articles, company_name)
-
-    if stock_data:
-        closing_price = stock_data["closing_price"]
-        change_percent = stock_data["change_percent"]
-
-        update = (
-            f"**{company_name} ({stock_symbol}):**\n"
-            f"Today's Closing Price: ${closing_price:.2f}\n"
-            f"Change Percent: {change_percent:.2f}%\n"
-            f"News Summary: {news_summary}\n\n"
+# Search results kept per company
+ARTICLES_PER_COMPANY = 5
+
+# Stale note for a section whose summary was extracted from the articles instead of written by the LLM
+EXTRACTIVE_NOTE = "summary extracted from headlines, the LLM was unavailable"
+
+def gather_company_data(company_name, stock_symbol, market_data=None):
+    """Fetches the stock data and latest news articles for one company.
+
+    `market_data` is this symbol's row from `market_data.fetch_market_data`; when it is
+    missing the agent falls back to fetching the symbol on its own.
+    """
+    with stale_notes() as stale:
+        with tracer.span("fetch", cached=market_data is not None), budget.stage("market_data"):
+            stock_data_agent = StockDataAgent(stock_symbol, market_data)
+            stock_data = stock_data_agent.get_stock_data()
+
+        with tracer.span("search"), budget.stage("news"):
+            news_agent = NewsAgent(company_name, stock_symbol)
+            news_articles = news_agent.fetch_news_articles()[:ARTICLES_PER_COMPANY]
+
+    return {
+        "company_name": company_name,
+        "stock_symbol": stock_symbol,
+        "stock_data": stock_data,
+        "news_articles": news_articles,
+        # Why this section is stale or partial, if it is
+        "stale": stale
+    }
+
+# Longer-horizon changes shown under the daily change, when the price history covers them
+HORIZON_LABELS = (("change_5d", "5-Day"), ("change_1m", "1-Month"), ("change_ytd", "YTD"))
+
+def price_lines(stock_data):
+    if not stock_data:
+        return "Today's Closing Price: unavailable\n"
+    lines = (
+        f"Today's Closing Price: ${stock_data['closing_price']:.2f}\n"
+        f"Change Percent: {stock_data['change_percent']:.2f}%\n"
+    )
+    horizons = [
+        f"{label}: {stock_data[key]:+.2f}%" for key, label in HORIZON_LABELS if stock_data.get(key) is not None
+    ]
+    return lines + (" | ".join(horizons) + "\n" if horizons else "")
+
+def format_company_update(company_data, news_summary):
+    """Renders a company update string from gathered data and its news summary."""
+    company_name = company_data["company_name"]
+    stock_symbol = company_data["stock_symbol"]
+    stock_data = company_data["stock_data"]
+
+    stale = company_data.get("stale")
+
+    # A section already degraded by the deadline is published without its price rather than dropped
+    if stock_data or stale:
+        update = f"**{company_name} ({stock_symbol}):**\n" + price_lines(stock_data) + (
+            f"News Summary: {news_summary}\n"
+            f"{stale_line(stale)}\n"
         )
         return update
     else:
-        return f"Could not retrieve data for {company_name} ({stock_symbol})\n\n"
\ No newline at end of file
+        return f"Could not retrieve data for {company_name} ({stock_symbol})\n\n"
+
+def generate_company_update(company_name, stock_symbol, market_data=None, prompt_articles=None):
+    """Generates a company update string with stock data and news summary.
+
+    `prompt_articles` is this symbol's row from `tasks.condensed_news`; without it the
+    articles are trimmed and condensed here.
+    """
+    company_data = gather_company_data(company_name, stock_symbol, market_data)
+
+    with tracer.span("summarize"), budget.stage("summarize"):
+        summary_agent = SummaryAgent()
+        news_articles = company_data["news_articles"]
+        if prompt_articles is None:
+            news_articles = article_index.novel(stock_symbol, news_articles)
+        news_summary = summary_agent.summarize(news_articles, company_name, prompt_articles=prompt_articles)
+    if summary_agent.fallbacks:
+        company_data["stale"].append(EXTRACTIVE_NOTE)
+
+    return format_company_update(company_data, news_summary)
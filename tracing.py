@@ -0,0 +1,189 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed stage of a run. Spans nest: run > company > fetch/search/summarize > provider call."""
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.children = []
+        self.errors = []
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "attributes": self.attributes,
+            "start": self.start,
+            "duration_seconds": self.duration,
+            "errors": self.errors,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+class Tracer:
+    """Collects nested timing spans and labelled counters for a newsletter run.
+
+    Spans follow the current context, so work handed to a thread pool must be wrapped
+    with `wrap` to stay nested under the span that submitted it. With profiling enabled,
+    `wrap` also runs each task under its own cProfile profiler so worker threads show up in
+    the profile.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.profiling = False
+        self.start_run()
+
+    def start_run(self):
+        with self._lock:
+            self.spans = []
+            self.counters = defaultdict(float)
+            self.started_at = datetime.now()
+            self._profiles = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        span = Span(name, attributes)
+        with self._lock:
+            (parent.children if parent else self.spans).append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.errors.append(repr(e))
+            raise
+        finally:
+            span.duration = time.time() - span.start
+            _current_span.reset(token)
+
+    def count(self, name, value=1, **labels):
+        """Adds `value` to the counter `name` with the given labels."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def error(self, error, stage=None):
+        """Records a handled error against the current span and the errors counter."""
+        span = _current_span.get()
+        if span is not None:
+            span.errors.append(repr(error))
+        self.count("errors", stage=stage or (span.name if span else "run"))
+
+    def annotate(self, **attributes):
+        span = _current_span.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+    def wrap(self, fn):
+        """Binds `fn` to the current span context (and profiler) for running on another thread."""
+        context = contextvars.copy_context()
+
+        def run(*args, **kwargs):
+            if not self.profiling:
+                return context.run(fn, *args, **kwargs)
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(context.run, fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._profiles.append(profile)
+        return run
+
+    @contextmanager
+    def profile(self, path):
+        """Profiles the enclosed block and every wrapped task, then dumps combined stats to `path`."""
+        import cProfile
+        import pstats
+        self.profiling = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.profiling = False
+            stats = pstats.Stats(profile)
+            with self._lock:
+                for task_profile in self._profiles:
+                    stats.add(task_profile)
+            stats.dump_stats(path)
+
+    def to_dict(self, extra_metrics=None):
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+        return {
+            "started_at": self.started_at.isoformat(),
+            "spans": [span.to_dict() for span in self.spans],
+            "counters": counters,
+            "metrics": extra_metrics or {}
+        }
+
+    def stage_totals(self):
+        """Total seconds and span count per span name, across the whole run."""
+        totals = defaultdict(lambda: [0.0, 0])
+
+        def visit(span):
+            if span.duration is not None:
+                totals[span.name][0] += span.duration
+                totals[span.name][1] += 1
+            for child in span.children:
+                visit(child)
+        for span in self.spans:
+            visit(span)
+        return totals
+
+    def export(self, directory, extra_metrics=None):
+        """Writes trace-<timestamp>.json and metrics.prom for the current run into `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        trace_path = os.path.join(directory, f"trace-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(extra_metrics), f, indent=2)
+        with open(os.path.join(directory, "metrics.prom"), "w", encoding="utf-8") as f:
+            f.write(self.prometheus(extra_metrics))
+        return trace_path
+
+    def prometheus(self, extra_metrics=None):
+        """Renders the run's stage timings and counters in the Prometheus text format."""
+        lines = [
+            "# HELP magseven_stage_seconds Total wall time spent in each pipeline stage.",
+            "# TYPE magseven_stage_seconds summary"
+        ]
+        for stage, (seconds, count) in sorted(self.stage_totals().items()):
+            lines.append(f'magseven_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+            lines.append(f'magseven_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"magseven_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{format_labels(labels)} {value:g}")
+
+        for metric, samples in sorted((extra_metrics or {}).items()):
+            lines.append(f"# TYPE magseven_{metric} gauge")
+            for labels, value in samples:
+                lines.append(f"magseven_{metric}{format_labels(sorted(labels.items()))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+tracer = Tracer()
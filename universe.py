@@ -0,0 +1,69 @@
+import csv
+import json
+import os
+from collections import namedtuple
+from config import UNIVERSE
+
+UNIVERSE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "universes")
+
+Company = namedtuple("Company", ["name", "symbol"])
+
+# The basket-wide section at the top of the newsletter: an ETF tracking the universe and
+# the news query used for its summary.
+Overview = namedtuple("Overview", ["name", "symbol", "title", "query"])
+
+# `key` identifies the universe in checkpoint run ids; `path` lets worker processes reload it.
+Universe = namedtuple("Universe", ["key", "name", "companies", "overview", "path"])
+
+def universe_path(universe=UNIVERSE):
+    """Resolves a universe file path, or the name of a file under universes/ (without extension)."""
+    if os.path.exists(universe):
+        return universe
+    for extension in (".json", ".csv"):
+        path = os.path.join(UNIVERSE_DIR, universe + extension)
+        if os.path.exists(path):
+            return path
+    raise ValueError(f"Unknown universe {universe!r}: no such file, and nothing matching in {UNIVERSE_DIR}")
+
+def load_universe(universe=UNIVERSE):
+    """Loads a ticker universe from a JSON or CSV file.
+
+    JSON files hold a "name", an optional "overview" ({"name", "symbol", "title", "query"})
+    and a list of "companies" ({"name", "symbol"}). CSV files, convenient for index
+    constituent lists, need "symbol" and "name" columns and have no overview section.
+    Companies keep file order; a symbol listed twice is kept once.
+    """
+    path = universe_path(universe)
+    key = os.path.splitext(os.path.basename(path))[0]
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [{name.strip().lower(): value for name, value in row.items() if name} for row in csv.DictReader(f)]
+        definition = {"name": key.replace("_", " ").title(), "companies": rows}
+    else:
+        with open(path, encoding="utf-8") as f:
+            definition = json.load(f)
+
+    companies, seen = [], set()
+    for row in definition.get("companies", []):
+        symbol = (row.get("symbol") or "").strip().upper()
+        if not symbol or symbol in seen:
+            continue
+        seen.add(symbol)
+        companies.append(Company((row.get("name") or symbol).strip(), symbol))
+    if not companies:
+        raise ValueError(f"Universe {path} lists no companies")
+
+    overview = definition.get("overview")
+    if overview:
+        overview = Overview(overview["name"], overview["symbol"].upper(),
+                            overview.get("title", overview["symbol"].upper()),
+                            overview.get("query", f"{overview['name']} stock news"))
+    return Universe(key, definition.get("name", key), companies, overview or None, path)
+
+def shard(companies, shard_index, shard_count):
+    """Returns the `shard_index`-th of `shard_count` contiguous, near-equal slices of `companies`."""
+    size, extra = divmod(len(companies), shard_count)
+    start = shard_index * size + min(shard_index, extra)
+    return companies[start:start + size + (1 if shard_index < extra else 0)]
+
+MAGNIFICENT_SEVEN = load_universe(os.path.join(UNIVERSE_DIR, "magnificent_seven.json"))